@@ -0,0 +1,109 @@
+"""
+Computerized adaptive testing (CAT) utilities for the main vertical processing test.
+
+Each chord type is treated as an item in a two-parameter logistic (2PL) IRT model,
+where the expected proportion of correctly sung notes for a participant with ability ``theta`` is
+
+    p = 1 / (1 + exp(-a * (theta - b)))
+
+with ``a`` the item's discrimination and ``b`` its difficulty. Trial scores are converted
+to proportions (score divided by the number of notes in the chord) and treated as
+fractional Bernoulli outcomes, one per trial: the notes of a chord are sung in a single response,
+so their errors are strongly correlated and counting them separately would overstate the precision.
+Abilities are estimated by expected a posteriori (EAP) estimation over a fixed grid,
+with a standard normal prior.
+
+Items are selected by the randomesque method: one of the few most informative chord types
+is chosen at random, which spreads exposure across chord types with similar parameters.
+"""
+import json
+import random
+
+import numpy as np
+
+ITEM_PARAMETERS_PATH = "item_parameters.json"
+
+THETA_GRID = np.linspace(-4, 4, 161)
+LOG_PRIOR = -0.5 * THETA_GRID ** 2
+
+N_SELECTION_CANDIDATES = 3
+
+
+def chord_type_key(chord_type):
+    return "-".join(str(pitch) for pitch in chord_type)
+
+
+def load_item_parameters(path=ITEM_PARAMETERS_PATH):
+    """
+    Returns a dictionary mapping chord type keys (see ``chord_type_key``)
+    to dictionaries of the form ``{"a": discrimination, "b": difficulty}``.
+    """
+    with open(path) as file:
+        return json.load(file)["items"]
+
+
+def expected_proportion(theta, a, b):
+    return 1 / (1 + np.exp(-a * (theta - b)))
+
+
+def item_information(theta, a, b):
+    p = expected_proportion(theta, a, b)
+    return a ** 2 * p * (1 - p)
+
+
+def trial_information(chord_type, theta, item_parameters):
+    return item_information(theta, **item_parameters[chord_type_key(chord_type)])
+
+
+def predict_standard_error(standard_error, information):
+    """
+    Approximates the standard error of the ability estimate after a trial with the given information.
+    """
+    return 1 / np.sqrt(1 / standard_error ** 2 + information)
+
+
+def estimate_ability(responses, item_parameters):
+    """
+    Computes the EAP ability estimate and its standard error.
+
+    Parameters
+    ----------
+    responses :
+        List of ``(chord_type, proportion_correct)`` tuples.
+    item_parameters :
+        Output of ``load_item_parameters``.
+
+    Returns
+    -------
+    Tuple of ``(theta, standard_error)``.
+    """
+    log_posterior = LOG_PRIOR.copy()
+
+    if len(responses) > 0:
+        parameters = [item_parameters[chord_type_key(chord_type)] for chord_type, _ in responses]
+        a = np.array([item["a"] for item in parameters])[:, None]
+        b = np.array([item["b"] for item in parameters])[:, None]
+        x = np.clip([proportion for _, proportion in responses], 0, 1)[:, None]
+
+        p = np.clip(expected_proportion(THETA_GRID[None, :], a, b), 1e-9, 1 - 1e-9)
+        log_posterior += (x * np.log(p) + (1 - x) * np.log(1 - p)).sum(axis=0)
+
+    posterior = np.exp(log_posterior - log_posterior.max())
+    posterior /= posterior.sum()
+
+    theta = float((THETA_GRID * posterior).sum())
+    standard_error = float(np.sqrt(((THETA_GRID - theta) ** 2 * posterior).sum()))
+    return theta, standard_error
+
+
+def select_item(chord_types, theta, item_parameters, rng=random, n_candidates=N_SELECTION_CANDIDATES):
+    """
+    Returns the index of a chord type chosen at random (using ``rng``) from the ``n_candidates``
+    most informative at ability ``theta``. Ties are broken at random, so that chord types
+    with identical parameters are equally likely to be given.
+    """
+    order = list(range(len(chord_types)))
+    rng.shuffle(order)
+    information = [trial_information(chord_types[i], theta, item_parameters) for i in order]
+    ranked = [order[i] for i in np.argsort(information, kind="stable")[::-1]]
+    return rng.choice(ranked[:n_candidates])
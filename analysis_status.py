@@ -0,0 +1,55 @@
+"""
+Shared state describing the load on the analysis workers, kept in Redis so that
+the web processes, the async workers, and ``worker_supervisor.py`` all see the same values.
+"""
+import json
+import time
+
+ANALYSIS_TIMES_KEY = "vertical_processing:analysis_times"
+STATUS_KEY = "vertical_processing:analysis_status"
+N_RECENT_ANALYSIS_TIMES = 50
+
+
+def record_analysis_time(redis_conn, seconds):
+    pipeline = redis_conn.pipeline()
+    pipeline.lpush(ANALYSIS_TIMES_KEY, seconds)
+    pipeline.ltrim(ANALYSIS_TIMES_KEY, 0, N_RECENT_ANALYSIS_TIMES - 1)
+    pipeline.execute()
+
+
+def get_mean_analysis_time(redis_conn, default=None):
+    times = [float(x) for x in redis_conn.lrange(ANALYSIS_TIMES_KEY, 0, -1)]
+    if len(times) == 0:
+        return default
+    return sum(times) / len(times)
+
+
+def publish_status(redis_conn, queue_depth, n_workers, mean_analysis_time, expires_after):
+    status = {
+        "queue_depth": queue_depth,
+        "n_workers": n_workers,
+        "mean_analysis_time": mean_analysis_time,
+        "estimated_feedback_delay": estimate_feedback_delay(queue_depth, n_workers, mean_analysis_time),
+        "updated_at": time.time(),
+    }
+    redis_conn.set(STATUS_KEY, json.dumps(status), ex=expires_after)
+    return status
+
+
+def get_status(redis_conn):
+    """
+    Returns the latest status published by ``worker_supervisor.py``,
+    or ``None`` if the supervisor isn't running.
+    """
+    status = redis_conn.get(STATUS_KEY)
+    if status is None:
+        return None
+    return json.loads(status)
+
+
+def estimate_feedback_delay(queue_depth, n_workers, mean_analysis_time):
+    """
+    Expected time until a newly submitted recording has been analysed:
+    the time to clear the queue ahead of it, plus its own analysis.
+    """
+    return (queue_depth / max(n_workers, 1) + 1) * mean_analysis_time
@@ -0,0 +1,64 @@
+"""
+Replaces the original recordings of finished trials with compressed copies (see ``audio_codec``),
+to reduce storage once the data have been collected.
+
+Usage (with the local experiment running):
+
+    bash docker/run python archive_recordings.py [trial_id ...]
+
+If no trial IDs are given, the recordings of all vertical processing trials are archived.
+This permanently deletes the original uploads, so it is never run by the experiment itself.
+Each archived trial's answer is updated to point at its compressed recording, and
+re-analysis (see ``reanalyse_trials.py``) and replays (see ``replay_session.py``) decode it.
+Trials whose participant is still taking the experiment, or whose analysis is still pending, are skipped.
+The work goes through the rate-limited batch lane (see ``scheduling``), so it never delays live participants.
+"""
+import argparse
+import os
+
+import redis
+
+from dallinger import db
+from psynet.experiment import import_local_experiment
+from psynet.trial.main import Trial
+
+import scheduling
+
+TRIAL_MAKER_IDS = ["practice_vertical_processing_trials", "main_vertical_processing_trials"]
+
+
+def archive_trial(trial_id):
+    import_local_experiment()
+    trial = Trial.query.filter_by(id=trial_id).one()
+    if "singing" in trial.assets:  # Not archived already
+        trial.archive_recording()
+        db.session.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trial_ids", nargs="*", type=int)
+    parser.add_argument("--max-pending", type=int, default=scheduling.MAX_PENDING_BATCH_JOBS)
+    args = parser.parse_args(argv)
+
+    import_local_experiment()
+    redis_conn = redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+
+    query = Trial.query.filter(Trial.trial_maker_id.in_(TRIAL_MAKER_IDS))
+    if args.trial_ids:
+        query = query.filter(Trial.id.in_(args.trial_ids))
+
+    batch = []
+    for trial in query.order_by(Trial.id):
+        if trial.participant.status == "working" or trial.async_post_trial_pending:
+            print(f"Skipping trial {trial.id}, which is still in progress.")
+            continue
+        if "singing" in trial.assets:
+            batch.append((trial.id,))
+
+    jobs = scheduling.submit_batch(redis_conn, archive_trial, batch, max_pending=args.max_pending)
+    print(f"Submitted {len(jobs)} archival jobs.")
+
+
+if __name__ == "__main__":
+    main()
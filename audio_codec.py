@@ -0,0 +1,106 @@
+"""
+Compact storage format for singing recordings.
+
+Recordings arrive as 44.1 kHz WAV files, but the analysis only looks at content
+below 8 kHz (see ``singing_bandpass_range`` and ``singing_bandpass_range_praat_syllable``
+in ``singing_analysis.SING4ME_CONFIG``), and participants typically only sing for part
+of the recording window. We therefore trim leading/trailing silence, downsample,
+and encode the result as FLAC. ``decode_recording`` reverses this, restoring the
+original sample rate and timing so that sing4me sees a recording of the expected shape.
+
+Audio I/O goes through parselmouth, which sing4me already depends on.
+"""
+import math
+
+import numpy as np
+import parselmouth
+from scipy import signal
+
+STORAGE_SAMPLE_RATE = 22050  # Nyquist frequency of 11025 Hz covers the 8 kHz upper analysis band
+TRIM_THRESHOLD_DB = -50  # Frames quieter than this (relative to the loudest frame) count as silence
+TRIM_FRAME_MS = 10
+TRIM_PADDING_MS = 150  # Silence kept either side of the sung material, so that onsets/offsets are not clipped
+
+
+def encode_recording(input_path, output_path, sample_rate=STORAGE_SAMPLE_RATE):
+    """
+    Trims, downsamples, and FLAC-encodes the recording at ``input_path``.
+    Returns a JSON-serializable dictionary that must be passed to ``decode_recording``.
+    """
+    audio, original_sample_rate = read_audio(input_path)
+
+    start, end = find_sound_bounds(audio, original_sample_rate)
+    compressed = resample(audio[start:end], original_sample_rate, sample_rate)
+
+    write_audio(output_path, compressed, sample_rate, parselmouth.SoundFileFormat.FLAC)
+
+    return {
+        "sample_rate": sample_rate,
+        "original_sample_rate": int(original_sample_rate),
+        "original_n_samples": len(audio),
+        "trim_start": int(start),
+        "trim_end": int(end),
+    }
+
+
+def decode_recording(input_path, output_path, info):
+    """
+    Decodes a recording produced by ``encode_recording`` into a WAV file
+    with the original sample rate, duration, and timing.
+    """
+    audio, sample_rate = read_audio(input_path)
+    audio = resample(audio, sample_rate, info["original_sample_rate"])
+
+    restored = np.zeros(info["original_n_samples"], dtype="float32")
+    n_samples = min(len(audio), info["trim_end"] - info["trim_start"])
+    restored[info["trim_start"]:info["trim_start"] + n_samples] = audio[:n_samples]
+
+    write_audio(output_path, restored, info["original_sample_rate"], parselmouth.SoundFileFormat.WAV)
+
+
+def read_audio(path):
+    """
+    Returns the recording as a mono float32 array, together with its sample rate.
+    """
+    sound = parselmouth.Sound(str(path))
+    return sound.values.mean(axis=0).astype("float32"), int(sound.sampling_frequency)
+
+
+def write_audio(path, audio, sample_rate, file_format):
+    sound = parselmouth.Sound(np.clip(audio, -1.0, 1.0).astype("float64"), sampling_frequency=sample_rate)
+    sound.save(str(path), file_format)
+
+
+def find_sound_bounds(audio, sample_rate):
+    """
+    Returns the (start, end) sample indices of the non-silent part of the recording,
+    including some padding. Falls back to the full recording if it is entirely silent.
+    """
+    frame_length = max(1, int(sample_rate * TRIM_FRAME_MS / 1000))
+    n_frames = len(audio) // frame_length
+    if n_frames == 0:
+        return 0, len(audio)
+
+    frames = audio[:n_frames * frame_length].reshape(n_frames, frame_length)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    if rms.max() == 0:
+        return 0, len(audio)
+
+    rms_db = 20 * np.log10(np.maximum(rms, 1e-10) / rms.max())
+    loud_frames = np.flatnonzero(rms_db > TRIM_THRESHOLD_DB)
+
+    padding = int(sample_rate * TRIM_PADDING_MS / 1000)
+    start = max(0, loud_frames[0] * frame_length - padding)
+    end = min(len(audio), (loud_frames[-1] + 1) * frame_length + padding)
+    return start, end
+
+
+def resample(audio, original_sample_rate, target_sample_rate):
+    if original_sample_rate == target_sample_rate:
+        return audio
+    divisor = math.gcd(int(original_sample_rate), int(target_sample_rate))
+    return signal.resample_poly(
+        audio,
+        int(target_sample_rate) // divisor,
+        int(original_sample_rate) // divisor,
+    ).astype("float32")
@@ -0,0 +1,207 @@
+"""
+Fits chord-type item parameters for the adaptive test (see ``adaptive_testing``)
+from exported trial data, and writes them to ``item_parameters.json``.
+
+Usage:
+
+    python calibrate_items.py path/to/MainVerticalProcessingTrial.csv
+
+or, using the output of ``export_tables.py``,
+
+    python calibrate_items.py path/to/export_dir
+
+The model is the same 2PL model used by ``adaptive_testing``, fitted by joint
+maximum a posteriori estimation of participant abilities and item parameters.
+Priors on abilities (standard normal), log-discriminations, and difficulties
+keep the scale identified and stop items with few observations from drifting.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from scipy import optimize
+
+from adaptive_testing import ITEM_PARAMETERS_PATH, chord_type_key, load_item_parameters
+from scoring import score_response
+
+MAIN_TRIAL_MAKER_ID = "main_vertical_processing_trials"
+
+LOG_A_PRIOR_SD = 0.5
+B_PRIOR_SD = 2.0
+
+
+def load_trials(path, trial_maker_id=MAIN_TRIAL_MAKER_ID):
+    """
+    Reads a trial export and returns a list of ``(participant_id, chord_type, proportion_correct)`` tuples.
+
+    ``path`` may be either a CSV file, with flattened columns (``chord_type``, ``target_pitches``,
+    ``sung_pitches``) or the JSON-encoded ``definition``/``var`` columns of the standard PsyNet export,
+    or the output directory of ``export_tables.py``.
+    Trials whose recording was rejected as unusable (see ``recording_quality``) are skipped,
+    as their score of zero says nothing about the chord type's difficulty.
+    """
+    if os.path.isdir(path):
+        rows = iterate_dataset_rows(path, trial_maker_id)
+    else:
+        rows = iterate_csv_rows(path, trial_maker_id)
+
+    trials = []
+    for row in rows:
+        if row.get("failed") in (True, "True"):
+            continue
+
+        definition = json.loads(row["definition"]) if row.get("definition") else {}
+        var = json.loads(row["var"]) if row.get("var") else {}
+        if get_recording_problem(row, var):
+            continue
+
+        chord_type = parse_field(row, definition, "chord_type", "definition.chord_type")
+        score = row.get("score")
+        if score not in (None, ""):
+            score = float(score)
+        else:
+            target_pitches = parse_field(row, definition, "target_pitches", "definition.target_pitches")
+            sung_pitches = parse_field(row, var, "sung_pitches", "var.sung_pitches")
+            if target_pitches is None or sung_pitches is None:
+                continue
+            score = score_response(target=target_pitches, response=sung_pitches)
+
+        trials.append((row["participant_id"], chord_type, score / len(chord_type)))
+    return trials
+
+
+def iterate_csv_rows(path, trial_maker_id):
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            if row.get("trial_maker_id", trial_maker_id) == trial_maker_id:
+                yield row
+
+
+def iterate_dataset_rows(path, trial_maker_id):
+    import pyarrow.parquet
+
+    directory = os.path.join(path, "trials", f"trial_maker_id={trial_maker_id}")
+    for filename in sorted(os.listdir(directory)):
+        yield from pyarrow.parquet.read_table(os.path.join(directory, filename)).to_pylist()
+
+
+def parse_field(row, fallback, key, flattened_key):
+    for column in (key, flattened_key):
+        if row.get(column):
+            return json.loads(row[column])
+    return fallback.get(key)
+
+
+def get_recording_problem(row, var):
+    problem = row.get("var.recording_quality.problem")
+    if problem:
+        return problem
+    return (var.get("recording_quality") or {}).get("problem")
+
+
+def fit(trials, chord_type_keys):
+    participants = sorted({participant_id for participant_id, _, _ in trials})
+    participant_index = {participant_id: i for i, participant_id in enumerate(participants)}
+    item_index = {key: i for i, key in enumerate(chord_type_keys)}
+
+    p_idx = np.array([participant_index[participant_id] for participant_id, _, _ in trials])
+    i_idx = np.array([item_index[chord_type_key(chord_type)] for _, chord_type, _ in trials])
+    x = np.clip(np.array([proportion for _, _, proportion in trials]), 0, 1)
+
+    n_participants, n_items = len(participants), len(chord_type_keys)
+
+    def unpack(params):
+        return (
+            params[:n_participants],
+            params[n_participants:n_participants + n_items],
+            params[n_participants + n_items:],
+        )
+
+    def objective(params):
+        theta, log_a, b = unpack(params)
+        a = np.exp(log_a)
+
+        eta = a[i_idx] * (theta[p_idx] - b[i_idx])
+        p = 1 / (1 + np.exp(-eta))
+
+        # Negative log posterior; logaddexp keeps the likelihood stable for large |eta|
+        loss = (x * np.logaddexp(0, -eta) + (1 - x) * np.logaddexp(0, eta)).sum()
+        loss += 0.5 * (theta ** 2).sum()
+        loss += 0.5 * ((log_a / LOG_A_PRIOR_SD) ** 2).sum()
+        loss += 0.5 * ((b / B_PRIOR_SD) ** 2).sum()
+
+        residual = p - x  # d(loss)/d(eta)
+        grad_theta = np.bincount(p_idx, residual * a[i_idx], minlength=n_participants) + theta
+        grad_log_a = np.bincount(
+            i_idx, residual * eta, minlength=n_items
+        ) + log_a / LOG_A_PRIOR_SD ** 2
+        grad_b = np.bincount(i_idx, -residual * a[i_idx], minlength=n_items) + b / B_PRIOR_SD ** 2
+
+        return loss, np.concatenate([grad_theta, grad_log_a, grad_b])
+
+    result = optimize.minimize(
+        objective,
+        np.zeros(n_participants + 2 * n_items),
+        jac=True,
+        method="L-BFGS-B",
+    )
+    _, log_a, b = unpack(result.x)
+    n_observations = np.bincount(i_idx, minlength=n_items)
+
+    return {
+        key: {"a": float(np.exp(log_a[i])), "b": float(b[i])}
+        for key, i in item_index.items()
+        if n_observations[i] > 0
+    }, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trials", help="CSV export of main trials, or an export_tables.py output directory")
+    parser.add_argument("--output", default=ITEM_PARAMETERS_PATH)
+    parser.add_argument("--trial-maker-id", default=MAIN_TRIAL_MAKER_ID)
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+
+    with open("chord_types.json") as file:
+        chord_type_keys = [chord_type_key(chord_type) for chord_type in json.load(file)]
+
+    trials = load_trials(args.trials, args.trial_maker_id)
+    if len(trials) == 0:
+        sys.exit("No usable trials found.")
+
+    fitted, result = fit(trials, chord_type_keys)
+    if not result.success:
+        print(f"Warning: optimizer did not converge ({result.message}).")
+
+    # Chord types that nobody has been tested on keep their previous parameters
+    items = load_item_parameters()
+    items.update(fitted)
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "version": datetime.now().strftime("calibrated-%Y%m%d-%H%M%S"),
+                "source": f"Fitted by calibrate_items.py from {args.trials}.",
+                "n_trials": len(trials),
+                "n_participants": len({participant_id for participant_id, _, _ in trials}),
+                "items": items,
+            },
+            file,
+            indent=4,
+        )
+
+    print(
+        f"Calibrated {len(fitted)} of {len(chord_type_keys)} chord types from {len(trials)} trials "
+        f"in {time.perf_counter() - start_time:.1f} s; wrote {args.output}."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Reports how closely the fast YIN analysis backend agrees with sing4me
+on a directory of archived recordings (e.g. the assets of a data export).
+
+Usage:
+
+    python compare_backends.py path/to/recordings [--output agreement.csv]
+
+For each recording, both backends are run and their detected notes are matched
+(see ``match_notes``). The summary reports how often the backends detect the same
+number of notes, the proportion of notes matched within the tolerance, the mean
+absolute pitch difference between matched notes, and each backend's runtime.
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from singing_analysis import analyze_recording
+
+AUDIO_EXTENSIONS = (".wav", ".flac")
+PITCH_TOLERANCE = 0.5  # Semitones; matches the tolerance used by score_response
+
+
+def match_notes(reference, estimate, tolerance=PITCH_TOLERANCE):
+    """
+    Greedily pairs each estimated pitch with the closest unused reference pitch within ``tolerance``.
+    Returns a list of ``(reference_pitch, estimated_pitch)`` pairs.
+    """
+    remaining = list(reference)
+    matches = []
+    for pitch in estimate:
+        if len(remaining) == 0:
+            break
+        closest = min(remaining, key=lambda candidate: abs(candidate - pitch))
+        if abs(closest - pitch) < tolerance:
+            matches.append((closest, pitch))
+            remaining.remove(closest)
+    return matches
+
+
+def find_recordings(directory):
+    for root, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            if filename.lower().endswith(AUDIO_EXTENSIONS):
+                yield os.path.join(root, filename)
+
+
+def run_backend(audio_path, backend):
+    with tempfile.NamedTemporaryFile(suffix=".png") as f_plot:
+        start_time = time.perf_counter()
+        pitches = analyze_recording(audio_path, f_plot.name, backend=backend)["pitches"]
+        return pitches, time.perf_counter() - start_time
+
+
+def compare(audio_path):
+    sing4me_pitches, sing4me_time = run_backend(audio_path, "sing4me")
+    yin_pitches, yin_time = run_backend(audio_path, "yin")
+    matches = match_notes(sing4me_pitches, yin_pitches)
+
+    return {
+        "path": audio_path,
+        "n_notes_sing4me": len(sing4me_pitches),
+        "n_notes_yin": len(yin_pitches),
+        "n_matched": len(matches),
+        "mean_abs_pitch_difference": (
+            float(np.mean([abs(a - b) for a, b in matches])) if matches else None
+        ),
+        "time_sing4me": sing4me_time,
+        "time_yin": yin_time,
+    }
+
+
+def summarize(rows):
+    n_notes = sum(max(row["n_notes_sing4me"], row["n_notes_yin"]) for row in rows)
+    differences = [row["mean_abs_pitch_difference"] for row in rows if row["mean_abs_pitch_difference"] is not None]
+    return {
+        "n_recordings": len(rows),
+        "same_note_count": np.mean([row["n_notes_sing4me"] == row["n_notes_yin"] for row in rows]),
+        "notes_matched": sum(row["n_matched"] for row in rows) / n_notes if n_notes > 0 else 1.0,
+        "mean_abs_pitch_difference": np.mean(differences) if differences else float("nan"),
+        "mean_time_sing4me": np.mean([row["time_sing4me"] for row in rows]),
+        "mean_time_yin": np.mean([row["time_yin"] for row in rows]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recordings", help="Directory containing recordings (searched recursively)")
+    parser.add_argument("--output", default="agreement.csv", help="Where to write the per-recording results")
+    args = parser.parse_args(argv)
+
+    rows = [compare(path) for path in find_recordings(args.recordings)]
+    if len(rows) == 0:
+        raise SystemExit(f"No recordings found in {args.recordings}.")
+
+    with open(args.output, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    summary = summarize(rows)
+    print(f"Recordings analysed: {summary['n_recordings']}")
+    print(f"Same number of notes: {100 * summary['same_note_count']:.1f}%")
+    print(f"Notes matched within {PITCH_TOLERANCE} semitones: {100 * summary['notes_matched']:.1f}%")
+    print(f"Mean absolute pitch difference (matched notes): {summary['mean_abs_pitch_difference']:.3f} semitones")
+    print(f"Mean runtime: sing4me {summary['mean_time_sing4me']:.2f} s, yin {summary['mean_time_yin']:.2f} s")
+    print(f"Per-recording results written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
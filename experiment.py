@@ -1,14 +1,16 @@
 # pylint: disable=unused-import,abstract-method,unused-argument
 import json
 import math
+import os
 import random
 import tempfile
 import time
-from statistics import mean
+from statistics import mean, median
 
 from dallinger import db
+from dallinger.db import redis_conn
 from dominate import tags
-from scipy import stats
+import psutil
 
 import psynet.experiment
 from psynet.asset import ExperimentAsset, Asset, LocalStorage
@@ -18,13 +20,14 @@ from psynet.js_synth import JSSynth, Chord, InstrumentTimbre
 from psynet.modular_page import PushButtonControl, AudioRecordControl, MusicNotationPrompt, SurveyJSControl, \
     RadioButtonControl, AudioMeterControl, TextControl
 from psynet.page import InfoPage, SuccessfulEndPage, ModularPage
-from psynet.timeline import Timeline, Module, CodeBlock, Event, ProgressDisplay, ProgressStage, join
+from psynet.process import WorkerAsyncProcess
+from psynet.timeline import Timeline, Module, CodeBlock, Event, PageMaker, ProgressDisplay, ProgressStage, join
 from psynet.trial.static import StaticTrial, StaticNode, StaticTrialMaker
 from psynet.utils import get_logger
-from . import singing_analysis
+from . import adaptive_testing, analysis_status, audio_codec, recording_pipeline, recording_quality, scheduling, \
+    score_distribution, singing_analysis
 from .consent import consent
 from .instructions import instructions
-from .scoring import score_response
 from .utils import midi_to_abc
 
 logger = get_logger()
@@ -54,7 +57,7 @@ with open("chord_types.json") as file:
     ]
 
 
-TRIALS_PER_PARTICIPANT = 15
+TRIALS_PER_PARTICIPANT = 15  # Maximum number of main trials; the adaptive test may stop earlier
 
 
 AVAILABLE_TIMBRES = [
@@ -65,6 +68,18 @@ AVAILABLE_TIMBRES = [
 ]
 
 
+MAX_CHORD_SIZE = max(len(chord_type) for chord_type in chord_types)
+
+ROVING_RADIUS = 1.0  # The centre pitch of the chord roves +/- this value in semitones
+
+# Set to an integer to make every participant's stimuli reproducible across deployments (e.g. for load tests);
+# otherwise each participant gets a fresh seed, which is still recorded for replay (see get_trial_seed)
+TRIAL_SEED = None
+
+
+FEEDBACK_DELAY_WARNING = 10  # Warn participants if the estimated wait for feedback exceeds this (seconds)
+
+
 VOCAL_RANGES = {
     "soprano": 69,
     "alto": 65,
@@ -73,36 +88,73 @@ VOCAL_RANGES = {
 }
 
 
+def delete_asset(asset):
+    """
+    Deletes a deposited asset's stored file and database record.
+    The caller is responsible for removing it from its parent's ``assets`` first.
+    """
+    storage = asset.storage
+    if isinstance(storage, LocalStorage):
+        os.remove(storage.get_file_system_path(asset.host_path))
+    else:
+        storage.delete_file(asset.host_path)  # S3Storage
+
+    db.session.delete(asset)
+    db.session.flush()  # So that a replacement can be deposited under the same export path
+
+
+class AnalysisProcess(WorkerAsyncProcess):
+    """
+    Runs a trial's ``async_post_trial`` on the queue of the trial's priority lane (see ``scheduling``),
+    rather than on the ``default`` queue that PsyNet uses for all worker processes.
+    """
+
+    def get_launch_spec(self):
+        spec = super().get_launch_spec()
+        spec["lane"] = scheduling.lane_for_trial(self.trial)
+        return spec
+
+    @classmethod
+    def launch(cls, process):
+        scheduling.get_queue(redis_conn, process["lane"]).enqueue_call(
+            func=cls.call_function_with_logger,
+            args=(),
+            kwargs=dict(process_id=process["id"]),
+            timeout=process["timeout"],
+        )
+
+
 class VerticalProcessingTrial(StaticTrial):
     time_estimate = 15
 
     def finalize_definition(self, definition, experiment, participant):
         n_pitches = len(definition["chord_type"])
         definition["chord_duration"] = 3.5  # How long is the chord? (seconds)
-        definition["roving_radius"] = 1.0  # The centre pitch of the chord roves +/- this value in semitones
+        definition["roving_radius"] = ROVING_RADIUS
         definition["silence_duration"] = 1.0  # How long do we wait between the chord and the recording?
         definition["record_duration"] = 1.0 + (3 * 2.0)  # How long is the recording?
 
         # definition["timbre"] = ["piano" for _ in definition["chord_type"]]
 
+        draws = draw_next_trial_randomization(participant)
+
         if definition["timbre_type"] == "same":
-            _timbre = random.choice(AVAILABLE_TIMBRES)
-            definition["timbre"] = [_timbre for _ in range(n_pitches)]
+            definition["timbre"] = [draws["timbre"] for _ in range(n_pitches)]
         else:
             assert definition["timbre_type"] == "different"
-            definition["timbre"] = random.sample(AVAILABLE_TIMBRES, k=n_pitches)
-
-        mean_target_pitch = random.uniform(
-            participant.var.vocal_centre - self.definition["roving_radius"],
-            participant.var.vocal_centre + self.definition["roving_radius"]
-        )
+            if n_pitches > len(draws["timbres"]):
+                raise ValueError(f"Can't give each of {n_pitches} notes a different timbre from {AVAILABLE_TIMBRES}.")
+            definition["timbre"] = draws["timbres"][:n_pitches]
 
+        mean_target_pitch = draws["mean_target_pitch"]
         mean_original_pitch = mean(definition["chord_type"])
         pitch_translation = mean_target_pitch - mean_original_pitch
-        target_pitches = [p + pitch_translation for p in self.definition["chord_type"]]
+        target_pitches = [p + pitch_translation for p in definition["chord_type"]]
 
         definition["mean_target_pitch"] = mean_target_pitch
         definition["target_pitches"] = target_pitches
+        definition["randomization_seed"] = draws["randomization_seed"]
+        definition["randomization_index"] = draws["randomization_index"]
 
         return definition
 
@@ -119,6 +171,7 @@ class VerticalProcessingTrial(StaticTrial):
         with prompt:
             self.display_trial_position_alert()
             tags.p("Sing back the notes in the chord in any order.")
+            self.display_feedback_delay_alert()
 
         return ModularPage(
             "singing",
@@ -179,10 +232,23 @@ class VerticalProcessingTrial(StaticTrial):
             tags.p(
                 "Trial ",
                 tags.strong(self.position + 1),
-                " out of ",
+                " out of up to " if self.n_trials_is_maximum else " out of ",
                 tags.strong(self.expected_n_trials),
             )
+
+    def display_feedback_delay_alert(self):
+        status = analysis_status.get_status(redis_conn)
+        if status is not None and status["estimated_feedback_delay"] > FEEDBACK_DELAY_WARNING:
+            with tags.div():
+                tags.attr(cls="alert alert-warning")
+                tags.p(
+                    "Lots of people are taking this test right now, so your feedback may take about ",
+                    tags.strong(f"{status['estimated_feedback_delay']:.0f} seconds"),
+                    " to appear after you submit your recording.",
+                )
+
     expected_n_trials = None
+    n_trials_is_maximum = False  # True if the test can stop before expected_n_trials (see AdaptiveVerticalProcessingTrialMaker)
     wait_for_feedback = True
     show_running_score = False
     should_display_trial_position_alert = None
@@ -191,7 +257,13 @@ class VerticalProcessingTrial(StaticTrial):
         score = self.score
         assert isinstance(score, (float, int))
 
-        max_score = len(self.definition["chord_type"])
+        # The feedback is normally prepared once, by score_answer; we only rebuild it if the score has changed since
+        feedback = self.var.get("feedback", default=None)
+        if feedback is None or feedback["score"] != score:
+            feedback = self.prepare_feedback(score, participant)
+            self.var.feedback = feedback
+
+        max_score = feedback["max_score"]
 
         if score == max_score:
             alert_type = "success"
@@ -216,24 +288,47 @@ class VerticalProcessingTrial(StaticTrial):
                 )
 
                 if self.show_running_score:
-                    running_score = self.calculate_running_score(participant)
-                    assert isinstance(running_score, (float, int))
-
                     tags.p(
                         "Your total score so far is ",
-                        tags.strong(running_score),
+                        tags.strong(feedback["running_score"]),
                         "."
                     )
 
-            target_pitches_text, sung_pitches_text, abc = self.get_notation_for_feedback()
-            # tags.p(f"Target pitches = {target_pitches_text}, sung pitches = {sung_pitches_text}.")
+            if feedback.get("recording_problem") is not None:
+                with tags.div():
+                    tags.attr(cls="alert alert-warning")
+                    tags.p(recording_quality.PROBLEMS[feedback["recording_problem"]])
+
+            # tags.p(f"Target pitches = {feedback['target_pitches_text']}, sung pitches = {feedback['sung_pitches_text']}.")
 
         return ModularPage(
             "show_feedback",
-            MusicNotationPrompt(abc, text=text),
+            MusicNotationPrompt(feedback["abc"], text=text),
             time_estimate=0,
         )
 
+    def prepare_feedback(self, score, participant):
+        """
+        Computes the expensive parts of the feedback page (the music notation and the running score),
+        so that they can be stored with the trial rather than recomputed on every page load.
+        """
+        target_pitches_text, sung_pitches_text, abc = self.get_notation_for_feedback()
+
+        running_score = None
+        if self.show_running_score:
+            running_score = self.calculate_running_score(participant, score)
+            assert isinstance(running_score, (float, int))
+
+        return {
+            "score": score,
+            "max_score": len(self.definition["chord_type"]),
+            "running_score": running_score,
+            "target_pitches_text": target_pitches_text,
+            "sung_pitches_text": sung_pitches_text,
+            "abc": abc,
+            "recording_problem": self.recording_problem,
+        }
+
     def get_notation_for_feedback(self):
         target_pitches = self.definition["target_pitches"]
         transposition = target_pitches[0] - math.floor(target_pitches[0])  # Transpose down to the nearest integer
@@ -291,30 +386,136 @@ class VerticalProcessingTrial(StaticTrial):
                 assert False, "Throw an error here so we can check the logs and learn what happened"
                 ####
 
-            result = singing_analysis.analyze_recording(
-                f_audio.name,
-                f_plot.name
-            )
-            self.var.sung_pitches = result["pitches"]
-            self.var.singing_analysis = result["raw"]
+            # Unusable recordings (e.g. from a broken microphone) are rejected before the expensive analysis
+            quality = recording_pipeline.assess_quality(f_audio.name)
+            self.var.recording_quality = quality
+            if quality["problem"] is not None:
+                logger.info(f"Rejected the recording for trial {self.id}: {quality['problem']}.")
 
-            plot = ExperimentAsset(
-                f_plot.name,
-                local_key="plot",
+            self.analyze(f_audio.name, f_plot.name)
+
+    def reanalyse(self):
+        """
+        Analyses the trial's recording again, e.g. after a change to the analysis (see ``reanalyse_trials.py``).
+        The quality assessment made when the trial was first analysed is kept.
+        """
+        with tempfile.NamedTemporaryFile() as f_audio, tempfile.NamedTemporaryFile() as f_plot:
+            self.export_recording(f_audio.name)
+            self.analyze(f_audio.name, f_plot.name)
+
+    def analyze(self, audio_path, plot_path):
+        timings = {}
+        start_rss = psutil.Process().memory_info().rss
+        result = recording_pipeline.analyze(
+            audio_path,
+            plot_path,
+            self.recording_problem,
+            config=self.get_analysis_config(),
+            on_stage=timings.__setitem__,
+        )
+        if result is None:  # Rejected by the quality gate
+            self.var.sung_pitches = []
+            self.var.singing_analysis = None
+            return
+
+        self.var.analysis_time = timings["analysis"]
+        self.var.analysis_memory_delta_mb = (psutil.Process().memory_info().rss - start_rss) / 1e6
+        analysis_status.record_analysis_time(redis_conn, self.var.analysis_time)
+        logger.info(
+            f"Analysed trial {self.id} in {self.var.analysis_time:.2f} s; "
+            f"worker memory changed by {self.var.analysis_memory_delta_mb:+.1f} MB."
+        )
+
+        self.var.sung_pitches = result["pitches"]
+        self.var.singing_analysis = result["raw"]
+
+        if "plot" in self.assets:  # Re-analysis
+            previous_plot = self.assets["plot"]
+            del self.assets["plot"]
+            delete_asset(previous_plot)
+
+        plot = ExperimentAsset(
+            plot_path,
+            local_key="plot",
+            parent=self,
+            extension=".png",
+        )
+        plot.deposit()
+
+    def queue_async_post_trial(self):
+        # As in PsyNet, except that the analysis goes on its priority lane's queue
+        self.async_post_trial_requested = True
+        AnalysisProcess(
+            self.call_async_post_trial,
+            label="post_trial",
+            timeout=self.trial_maker.async_timeout_sec,
+            trial=self,
+            unique=True,
+        )
+
+    def export_recording(self, path):
+        """
+        Exports the participant's recording to ``path``, decoding it first if it has been archived
+        in compressed form (see ``archive_recording``).
+        """
+        if "singing" in self.assets:
+            self.assets["singing"].export(path)
+        else:
+            with tempfile.NamedTemporaryFile() as f_compressed:
+                self.assets["singing_compressed"].export(f_compressed.name)
+                audio_codec.decode_recording(f_compressed.name, path, self.var.recording_compression)
+
+    def archive_recording(self):
+        """
+        Replaces the participant's recording with a compressed copy (see ``audio_codec``),
+        and points the trial's answer at the copy. This permanently discards the original upload,
+        so it is only ever run explicitly, by ``archive_recordings.py``.
+        """
+        with tempfile.NamedTemporaryFile() as f_audio, tempfile.NamedTemporaryFile() as f_compressed:
+            self.assets["singing"].export(f_audio.name)
+            self.var.recording_compression = audio_codec.encode_recording(f_audio.name, f_compressed.name)
+
+            compressed_recording = ExperimentAsset(
+                f_compressed.name,
+                local_key="singing_compressed",
                 parent=self,
-                extension=".png",
+                extension=".flac",
             )
-            plot.deposit()
+            compressed_recording.deposit()
+            db.session.flush()  # Assigns the copy's ID
 
-    def score_answer(self, answer, definition):
-        return score_response( 
-            target=definition["target_pitches"],
-            response=self.var.sung_pitches,
-        )
+        self.answer = {**self.answer, "asset_id": compressed_recording.id, "url": compressed_recording.url}
+
+        recording = self.assets["singing"]
+        del self.assets["singing"]
+        delete_asset(recording)
 
-    def calculate_running_score(self, participant):
+    def get_analysis_config(self):
+        # Narrowed to the participant's own range by vocal_range_calibration(), where available
+        pitch_range_allowed = self.participant.var.get("pitch_range_allowed", default=None)
+        if pitch_range_allowed is None:
+            return singing_analysis.SING4ME_CONFIG
+        return {**singing_analysis.SING4ME_CONFIG, "pitch_range_allowed": pitch_range_allowed}
+
+    def score_answer(self, answer, definition):
+        score = recording_pipeline.score(definition["target_pitches"], self.var.sung_pitches, self.recording_problem)
+        try:
+            self.var.feedback = self.prepare_feedback(score, self.participant)
+        except Exception:
+            # A failure here mustn't lose the score; show_feedback will try again when the page is rendered
+            logger.exception(f"Failed to prepare the feedback for trial {self.id}.")
+            self.var.feedback = None
+        return score
+
+    @property
+    def recording_problem(self):
+        quality = self.var.get("recording_quality", default=None)
+        return None if quality is None else quality["problem"]
+
+    def calculate_running_score(self, participant, score):
+        # This trial's score may not have been saved yet, so we add it explicitly
         trials = self.__class__.query.filter_by(participant_id=participant.id).all()
-        return sum([trial.score for trial in trials if trial.score is not None])
+        return score + sum([trial.score for trial in trials if trial.score is not None and trial.id != self.id])
 
 
 class PracticeVerticalProcessingTrial(VerticalProcessingTrial):
@@ -327,6 +528,7 @@ class MainVerticalProcessingTrial(VerticalProcessingTrial):
     show_running_score = True
     should_display_trial_position_alert = True
     expected_n_trials = TRIALS_PER_PARTICIPANT
+    n_trials_is_maximum = True
 
 
 def requirements():
@@ -483,11 +685,141 @@ def get_voice_type():
             time_estimate=5,
             save_answer="voice_type"
         ),
-        CodeBlock(lambda participant: participant.var.set(
-                "vocal_centre",
-                VOCAL_RANGES[participant.var.voice_type],
+        CodeBlock(set_vocal_centre),
+    )
+
+
+def set_vocal_centre(participant):
+    # This is a provisional value, which vocal_range_calibration() refines
+    participant.var.set("vocal_centre", VOCAL_RANGES[participant.var.voice_type])
+
+
+def get_trial_seed(participant):
+    """
+    Returns the seed for the participant's trial randomization, creating it the first time.
+    Together with a trial's draw index (both stored in the trial definition),
+    this is enough to regenerate the trial's stimuli exactly (see ``replay_session.py``).
+    """
+    seed = participant.var.get("trial_seed", default=None)
+    if seed is None:
+        if TRIAL_SEED is None:
+            seed = random.SystemRandom().randrange(2 ** 32)
+        else:
+            seed = TRIAL_SEED + participant.id
+        participant.var.set("trial_seed", seed)
+    return seed
+
+
+def draw_trial_randomization(vocal_centre, seed, index):
+    # Each draw has its own random stream, so any one trial can be regenerated without replaying the others
+    rng = random.Random(f"{seed}:{index}")
+    return {
+        "timbre": rng.choice(AVAILABLE_TIMBRES),
+        # Always drawn, so that the draws after it don't depend on the trial's timbre type
+        "timbres": rng.sample(AVAILABLE_TIMBRES, k=min(MAX_CHORD_SIZE, len(AVAILABLE_TIMBRES))),
+        "mean_target_pitch": rng.uniform(vocal_centre - ROVING_RADIUS, vocal_centre + ROVING_RADIUS),
+        "randomization_seed": seed,
+        "randomization_index": index,
+    }
+
+
+def draw_next_trial_randomization(participant):
+    index = participant.var.get("n_trial_draws", default=0)
+    participant.var.set("n_trial_draws", index + 1)
+    return draw_trial_randomization(participant.var.vocal_centre, get_trial_seed(participant), index)
+
+
+class VocalRangeCalibrationTrial(StaticTrial):
+    time_estimate = 12
+    wait_for_feedback = True
+    record_duration = 7.0
+
+    def show_trial(self, experiment, participant):
+        prompt = tags.div()
+        with prompt:
+            tags.p(
+                "Before we start, we'd like to find out which notes are comfortable for you to sing. "
+                "When the recording starts, please sing three notes to 'ta', for 1-2 seconds each: "
+                "first a low note, then a note in the middle of your range, then a high note. "
+                "Only go as low and as high as feels comfortable."
             )
+
+        return ModularPage(
+            "vocal_range_calibration",
+            prompt,
+            AudioRecordControl(
+                duration=self.record_duration,
+                bot_response_media="example_audio.wav",
+            ),
+            events={
+                "recordStart": Event(is_triggered_by="trialStart", delay=1.0),
+                "submitEnable": Event(is_triggered_by="recordEnd"),
+            },
         )
+
+    def async_post_trial(self):
+        with tempfile.NamedTemporaryFile() as f_audio, tempfile.NamedTemporaryFile() as f_plot:
+            self.assets["vocal_range_calibration"].export(f_audio.name)
+            result = singing_analysis.analyze_recording(f_audio.name, f_plot.name)
+            self.var.sung_pitches = result["pitches"]
+            self.var.singing_analysis = result["raw"]
+
+    def show_feedback(self, experiment, participant):
+        return InfoPage(
+            "Thank you! We'll now choose chords that suit your voice.",
+            time_estimate=3,
+        )
+
+
+MIN_CALIBRATION_NOTES = 2
+MAX_CALIBRATION_DEVIATION = 7  # Semitones from the self-reported voice type's centre; further notes are treated as errors
+CHORD_PITCH_SPAN = 12 + 2 * ROVING_RADIUS  # The widest chord type spans an octave, and its position roves
+PITCH_RANGE_MARGIN = 3  # Semitones allowed beyond the participant's comfortable range when analysing their singing
+
+
+def set_calibrated_vocal_range(participant):
+    """
+    Sets the participant's vocal centre, and the pitch range searched when analysing their singing,
+    from the notes they sang in the calibration trial. Notes far from their self-reported voice type
+    (typically octave errors or spurious detections) are ignored, and the centre is the median note,
+    so that a single bad note can't move it far. If we couldn't detect enough plausible notes,
+    we keep the vocal centre from their self-reported voice type and the default pitch range.
+    """
+    trial = VocalRangeCalibrationTrial.query.filter_by(participant_id=participant.id).first()
+    sung_pitches = trial.var.get("sung_pitches", default=[]) if trial is not None else []
+
+    reported_centre = VOCAL_RANGES[participant.var.voice_type]
+    sung_pitches = [pitch for pitch in sung_pitches if abs(pitch - reported_centre) <= MAX_CALIBRATION_DEVIATION]
+
+    if len(sung_pitches) >= MIN_CALIBRATION_NOTES:
+        lowest, highest = min(sung_pitches), max(sung_pitches)
+        vocal_centre = median(sung_pitches)
+        participant.var.set("vocal_centre", vocal_centre)
+
+        default_low, default_high = singing_analysis.SING4ME_CONFIG["pitch_range_allowed"]
+        participant.var.set(
+            "pitch_range_allowed",
+            [
+                max(default_low, min(lowest, vocal_centre - CHORD_PITCH_SPAN / 2) - PITCH_RANGE_MARGIN),
+                min(default_high, max(highest, vocal_centre + CHORD_PITCH_SPAN / 2) + PITCH_RANGE_MARGIN),
+            ],
+        )
+
+
+def vocal_range_calibration():
+    return Module(
+        "vocal_range_calibration",
+        StaticTrialMaker(
+            id_="vocal_range_calibration",
+            trial_class=VocalRangeCalibrationTrial,
+            nodes=[StaticNode(definition={"task": "comfortable_notes"})],
+            expected_trials_per_participant=1,
+            max_trials_per_participant=1,
+            allow_repeated_nodes=False,
+            n_repeat_trials=0,
+            balance_across_nodes=False,
+        ),
+        CodeBlock(set_calibrated_vocal_range),
     )
 
 
@@ -500,26 +832,190 @@ class PracticeVerticalProcessingTrialMaker(VerticalProcessingTrialMaker):
 
 
 class MainVerticalProcessingTrialMaker(VerticalProcessingTrialMaker):
-    give_end_feedback_passed = True
+    # The end feedback is given by score_feedback_page() instead, which also needs to know the participant
+    give_end_feedback_passed = False
     performance_check_type = "score"
+    score_label = "total score"
 
-    def get_end_feedback_passed_page(self, score):
-        all_results = self.get_all_participant_performance_check_results()
-        all_scores = [results["score"] for results in all_results if results["score"] is not None]
-        percentile = stats.percentileofscore(all_scores, score)
+    def performance_check(self, experiment, participant, participant_trials):
+        result = super().performance_check(experiment, participant, participant_trials)
+        self.record_score_distribution(participant, participant_trials, result["score"])
+        return result
+
+    def record_score_distribution(self, participant, participant_trials, score):
+        """
+        Adds the participant to the shared score distributions (see ``score_distribution``),
+        and stores the groups they were added to so that the end page can compare them with each group.
+        """
+        groups = {
+            "overall": score,
+            f"voice_type:{participant.var.voice_type}": score,
+        }
+        for group, proportion in self.get_proportions_correct(participant_trials).items():
+            groups[group] = 100 * proportion
+
+        participant.var.score_groups = groups
+        if score_distribution.is_empty(redis_conn, self.id):
+            self.rebuild_score_distribution()
+        score_distribution.record_participant(redis_conn, self.id, participant.id, groups)
+
+    def rebuild_score_distribution(self):
+        """
+        Records everyone who has finished this trial maker in the score distributions,
+        e.g. after Redis has lost them. Participants who finished before we stored their groups
+        are only recorded in the overall and voice type distributions.
+        """
+        states = (
+            self.state_class.query
+            .filter_by(module_id=self.id)
+            .filter(self.state_class.performance_check.isnot(None))
+            .all()
+        )
+        for state in states:
+            groups = state.participant.var.get("score_groups", default=None)
+            if groups is None:
+                score = state.performance_check["score"]
+                groups = {"overall": score}
+                voice_type = state.participant.var.get("voice_type", default=None)
+                if voice_type is not None:
+                    groups[f"voice_type:{voice_type}"] = score
+            score_distribution.record_participant(redis_conn, self.id, state.participant_id, groups)
+        logger.info(f"Rebuilt the score distributions for {self.id} from {len(states)} participants.")
+
+    @staticmethod
+    def get_proportions_correct(participant_trials):
+        """
+        Returns the proportion of target notes that the participant sang correctly,
+        for each chord size and timbre they were tested on.
+        """
+        n_correct = {}
+        n_total = {}
+        for trial in participant_trials:
+            if trial.score is None or trial.recording_problem is not None:
+                continue
+            timbres = set(trial.definition["timbre"])
+            timbre = timbres.pop() if len(timbres) == 1 else "mixed"
+            chord_size = len(trial.definition["chord_type"])
+            for group in [f"chord_size:{chord_size}", f"timbre:{timbre}"]:
+                n_correct[group] = n_correct.get(group, 0) + trial.score
+                n_total[group] = n_total.get(group, 0) + chord_size
+        return {group: n_correct[group] / n_total[group] for group in n_total}
+
+    def score_feedback_page(self):
+        return PageMaker(self.show_score_feedback, time_estimate=7.5)
+
+    def show_score_feedback(self, participant):
+        groups = participant.var.score_groups
+        score = groups["overall"]
+        voice_type = participant.var.voice_type
+
+        # The participant was added to these distributions by performance_check, but Redis may have lost them since
+        if score_distribution.is_empty(redis_conn, self.id):
+            self.rebuild_score_distribution()
+
+        def get_top_percent(group):
+            percentile = score_distribution.get_percentile(redis_conn, self.id, group, groups[group])
+            return None if percentile is None else f"{100 - percentile:.0f}%"
+
+        top_percent_overall = get_top_percent("overall")
+        top_percent_voice_type = get_top_percent(f"voice_type:{voice_type}")
 
         html = tags.div()
         with html:
-            tags.p(
+            summary = tags.p(
                 "You finished the singing experiment! ",
-                "Your total score was ",
+                f"Your {self.score_label} was ",
                 tags.strong(f"{score}"),
-                f". This puts you in the top {100 - percentile:.0f}% of people who took the test so far."
+                ".",
             )
+            if top_percent_overall is not None:
+                summary.add(f" This puts you in the top {top_percent_overall} of people who took the test so far")
+                if top_percent_voice_type is not None:
+                    summary.add(f", and in the top {top_percent_voice_type} of people with a {voice_type} voice")
+                summary.add(".")
+
+            breakdown = sorted(group for group in groups if group.startswith(("chord_size:", "timbre:")))
+            if breakdown:
+                tags.p("Here's how you did on different kinds of chords:")
+                with tags.ul():
+                    for group in breakdown:
+                        kind, value = group.split(":")
+                        label = f"{value}-note chords" if kind == "chord_size" else f"{value} chords"
+                        item = tags.li(f"{label}: you sang {groups[group]:.0f}% of the notes correctly")
+                        top_percent = get_top_percent(group)
+                        if top_percent is not None:
+                            item.add(f" (top {top_percent} of people who took the test so far)")
+                        item.add(".")
 
         return InfoPage(html, time_estimate=7.5)
 
 
+class AdaptiveVerticalProcessingTrialMaker(MainVerticalProcessingTrialMaker):
+    """
+    Chooses each chord type to be highly informative about the participant's current
+    ability estimate (see ``adaptive_testing``), and stops early once that estimate
+    is sufficiently precise, or once no remaining chord type would make it noticeably more precise.
+    """
+    score_label = "ability score"
+    item_parameters = adaptive_testing.load_item_parameters()
+    # With one outcome per trial, each trial adds at most a^2 / 4 to the ability estimate's precision,
+    # so with the provisional parameters (a = 1) the standard error only reaches about 0.5 after 15 trials.
+    # In simulation, these settings stop after about 11 trials (12-13 for extreme abilities).
+    min_trials = 8
+    max_standard_error = 0.55
+    min_standard_error_reduction = 0.015
+
+    def custom_network_filter(self, candidates, participant):
+        theta, standard_error, n_trials = self.update_ability_estimate(participant)
+        chord_types = [network.head.definition["chord_type"] for network in candidates]
+
+        if n_trials >= self.min_trials and self.should_stop(chord_types, theta, standard_error):
+            return []
+
+        # Seeded like the other trial randomization (see get_trial_seed), so that sessions can be replayed
+        rng = random.Random(f"{get_trial_seed(participant)}:item:{n_trials}")
+        return [candidates[adaptive_testing.select_item(chord_types, theta, self.item_parameters, rng)]]
+
+    def should_stop(self, chord_types, theta, standard_error):
+        if standard_error < self.max_standard_error or len(chord_types) == 0:
+            return True
+        best_information = max(
+            adaptive_testing.trial_information(chord_type, theta, self.item_parameters)
+            for chord_type in chord_types
+        )
+        predicted = adaptive_testing.predict_standard_error(standard_error, best_information)
+        return standard_error - predicted < self.min_standard_error_reduction
+
+    def update_ability_estimate(self, participant):
+        trials = self.trial_class.query.filter_by(participant_id=participant.id).all()
+        responses = [
+            (trial.definition["chord_type"], trial.score / len(trial.definition["chord_type"]))
+            for trial in trials
+            # Rejected recordings score zero, but say nothing about the participant's ability
+            if trial.score is not None and trial.recording_problem is None
+        ]
+        theta, standard_error = adaptive_testing.estimate_ability(responses, self.item_parameters)
+
+        participant.var.ability_estimate = theta
+        participant.var.ability_standard_error = standard_error
+
+        return theta, standard_error, len(responses)
+
+    def performance_check(self, experiment, participant, participant_trials):
+        theta, _, _ = self.update_ability_estimate(participant)
+        score = self.ability_to_score(theta)
+        self.record_score_distribution(participant, participant_trials, score)
+        return {
+            "score": score,
+            "passed": True,
+        }
+
+    @staticmethod
+    def ability_to_score(theta):
+        # Reported on a conventional psychometric scale (mean 100, SD 15)
+        return round(100 + 15 * theta)
+
+
 def practice():
     html = tags.div()
 
@@ -557,7 +1053,7 @@ def main():
     with html:
         tags.p(
             "We're now ready to start the main experiment. "
-            "You'll take ",
+            "You'll take up to ",
             tags.strong(TRIALS_PER_PARTICIPANT),
             " trials in total. Good luck!"
         )
@@ -569,21 +1065,24 @@ def main():
                 tags.li("Sing each note for 1-2 seconds and leave a small gap between each one.")
                 tags.li("Try to avoid wobbling or sliding.")
 
+    trial_maker = AdaptiveVerticalProcessingTrialMaker(
+        id_="main_vertical_processing_trials",
+        trial_class=MainVerticalProcessingTrial,
+        nodes=NODES,
+        expected_trials_per_participant=TRIALS_PER_PARTICIPANT,
+        max_trials_per_participant=TRIALS_PER_PARTICIPANT,
+        recruit_mode="n_participants",
+        allow_repeated_nodes=False,
+        n_repeat_trials=0,
+        balance_across_nodes=False,
+        target_n_participants=50,
+        check_performance_at_end=True,
+    )
+
     return join(
         InfoPage(html, time_estimate=5),
-        MainVerticalProcessingTrialMaker(
-            id_="main_vertical_processing_trials",
-            trial_class=MainVerticalProcessingTrial,
-            nodes=NODES,
-            expected_trials_per_participant=TRIALS_PER_PARTICIPANT,
-            max_trials_per_participant=TRIALS_PER_PARTICIPANT,
-            recruit_mode="n_participants",
-            allow_repeated_nodes=False,
-            n_repeat_trials=0,
-            balance_across_nodes=False,
-            target_n_participants=50,
-            check_performance_at_end=True,
-        )
+        trial_maker,
+        trial_maker.score_feedback_page(),
     )
 
 
@@ -720,6 +1219,7 @@ class Exp(psynet.experiment.Experiment):
         overview(),
         equipment_test(),
         get_voice_type(),
+        vocal_range_calibration(),
         instructions(),
         practice(),
         main(),
@@ -0,0 +1,170 @@
+"""
+Streams trial and participant data from the experiment database into an
+analysis-ready, partitioned Parquet dataset.
+
+Usage (with the local experiment database running):
+
+    bash docker/run python export_tables.py path/to/output_dir
+
+The output has the following layout:
+
+    output_dir/
+        trials/trial_maker_id=<id>/part-<n>.parquet
+        participants/part-<n>.parquet
+
+Trial rows include the flattened trial definition (``definition.chord_type``,
+``definition.timbre``, ``definition.target_pitches``, ...) and trial variables
+(``var.sung_pitches``, ...). Participant rows include the flattened participant
+variables, which hold the voice type, vocal centre, and questionnaire answers
+(e.g. ``var.extra_questions.absolute_pitch``).
+
+Rows are read in fixed-size chunks using keyset pagination and each chunk is
+written straight to disk, so memory use does not grow with the size of the experiment.
+Fields only present for some rows (e.g. ``var.sung_pitches`` on failed trials)
+are null elsewhere: once everything has been written, each table's part files are
+rewritten one at a time to share a single schema, the union of all their columns.
+"""
+import argparse
+import json
+import os
+
+import pyarrow
+import pyarrow.parquet
+
+from dallinger import db
+from psynet.experiment import import_local_experiment
+from psynet.participant import Participant
+from psynet.trial.main import Trial
+
+CHUNK_SIZE = 1000
+
+
+def flatten(prefix, value, row):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten(f"{prefix}.{key}", item, row)
+    elif isinstance(value, (list, tuple)):
+        row[prefix] = json.dumps(value)
+    else:
+        row[prefix] = value
+
+
+def get_vars(obj):
+    return dict(obj.vars or {})
+
+
+def trial_to_row(trial):
+    row = {
+        "id": trial.id,
+        "participant_id": trial.participant_id,
+        "trial_maker_id": trial.trial_maker_id,
+        "type": type(trial).__name__,
+        "creation_time": trial.creation_time,
+        "failed": trial.failed,
+        "score": None if trial.score is None else float(trial.score),
+    }
+    flatten("definition", trial.definition or {}, row)
+    flatten("var", get_vars(trial), row)
+    return row
+
+
+def participant_to_row(participant):
+    row = {
+        "id": participant.id,
+        "status": participant.status,
+        "creation_time": participant.creation_time,
+        "failed": participant.failed,
+    }
+    flatten("var", get_vars(participant), row)
+    return row
+
+
+def iterate_chunks(query, model, chunk_size=CHUNK_SIZE):
+    last_id = 0
+    while True:
+        chunk = query.filter(model.id > last_id).order_by(model.id).limit(chunk_size).all()
+        if len(chunk) == 0:
+            return
+        last_id = chunk[-1].id
+        yield chunk
+        db.session.expunge_all()
+
+
+def write_chunk(rows, directory, part):
+    # Columns are taken from all rows, not just the first (as Table.from_pylist would)
+    columns = {}
+    for row in rows:
+        columns.update(dict.fromkeys(row))
+
+    os.makedirs(directory, exist_ok=True)
+    pyarrow.parquet.write_table(
+        pyarrow.Table.from_pydict({column: [row.get(column) for row in rows] for column in columns}),
+        os.path.join(directory, f"part-{part:05d}.parquet"),
+    )
+
+
+def unify_schemas(directory):
+    """
+    Rewrites the part files in ``directory`` so that they all share the union of their schemas,
+    with null values for the columns a part didn't have.
+    """
+    paths = [os.path.join(directory, filename) for filename in sorted(os.listdir(directory))]
+    schemas = [pyarrow.parquet.read_schema(path) for path in paths]
+    schema = pyarrow.unify_schemas(schemas, promote_options="permissive")
+
+    for path, part_schema in zip(paths, schemas):
+        if part_schema.equals(schema):
+            continue
+        table = pyarrow.parquet.read_table(path)
+        for field in schema:
+            if field.name not in table.column_names:
+                table = table.append_column(field.name, pyarrow.nulls(len(table), field.type))
+        pyarrow.parquet.write_table(table.select(schema.names).cast(schema), path)
+
+
+def export_trials(output_dir, chunk_size=CHUNK_SIZE):
+    n_rows = 0
+    for part, chunk in enumerate(iterate_chunks(Trial.query, Trial, chunk_size)):
+        partitions = {}
+        for trial in chunk:
+            partitions.setdefault(trial.trial_maker_id, []).append(trial_to_row(trial))
+        for trial_maker_id, rows in partitions.items():
+            write_chunk(rows, os.path.join(output_dir, "trials", f"trial_maker_id={trial_maker_id}"), part)
+        n_rows += len(chunk)
+    return n_rows
+
+
+def export_participants(output_dir, chunk_size=CHUNK_SIZE):
+    n_rows = 0
+    for part, chunk in enumerate(iterate_chunks(Participant.query, Participant, chunk_size)):
+        write_chunk(
+            [participant_to_row(participant) for participant in chunk],
+            os.path.join(output_dir, "participants"),
+            part,
+        )
+        n_rows += len(chunk)
+    return n_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_dir")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    # Registers the experiment's trial classes so that polymorphic queries can load them
+    import_local_experiment()
+
+    n_trials = export_trials(args.output_dir, args.chunk_size)
+    n_participants = export_participants(args.output_dir, args.chunk_size)
+
+    trials_dir = os.path.join(args.output_dir, "trials")
+    for partition in os.listdir(trials_dir) if os.path.isdir(trials_dir) else []:
+        unify_schemas(os.path.join(trials_dir, partition))
+    if os.path.isdir(os.path.join(args.output_dir, "participants")):
+        unify_schemas(os.path.join(args.output_dir, "participants"))
+    print(f"Exported {n_trials} trials and {n_participants} participants to {args.output_dir}.")
+
+
+if __name__ == "__main__":
+    main()
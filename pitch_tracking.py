@@ -0,0 +1,274 @@
+"""
+A fast, NumPy-only alternative to sing4me's Praat-based singing analysis.
+
+The recording is bandpass filtered, its amplitude envelope is segmented into notes
+using the same thresholds as sing4me (see ``singing_analysis.SING4ME_CONFIG``),
+and the f0 of each note is estimated with the YIN algorithm
+(de Cheveigné & Kawahara, 2002), computed for all frames at once via the FFT.
+
+The output mirrors sing4me's: a list of dictionaries, one per detected note,
+each with a ``median_f0`` entry expressed in MIDI semitones.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import signal
+
+YIN_THRESHOLD = 0.15  # Maximum cumulative mean normalized difference for a frame to count as voiced
+YIN_HOP_MS = 10
+NOISE_FLOOR_PERCENTILE = 10
+NOISE_MARGIN_DB = 6
+
+# The entries of singing_analysis.SING4ME_CONFIG that this backend reads; the rest are specific to sing4me
+CONFIG_KEYS = [
+    "allowed_pitch_flactuations_witin_one_tone",
+    "cut_post",
+    "cut_pre",
+    "db_end_threshold_realtive_2note_start",
+    "db_threshold",
+    "minimal_segment_duration",
+    "msec_silence",
+    "percent_of_flcatuating_within_one_tone",
+    "pitch_range_allowed",
+    "silence_beginning_ms",
+    "singing_bandpass_range",
+    "smoothing_env_window_ms",
+]
+
+
+def analyze(audio, sample_rate, config, plot_path=None, n_workers=1):
+    """
+    Detects the sung notes in ``audio`` (a mono float array).
+
+    Parameters
+    ----------
+    audio :
+        Mono audio samples.
+    sample_rate :
+        Sample rate of ``audio`` in Hz.
+    config :
+        Analysis parameters, in the format of ``singing_analysis.SING4ME_CONFIG``.
+    plot_path :
+        Optional path to which a PNG summary plot is saved.
+    n_workers :
+        Number of threads across which the per-segment pitch estimation is split.
+        The heavy lifting happens in NumPy's FFT routines, which release the GIL.
+    """
+    filtered = bandpass(audio, sample_rate, config["singing_bandpass_range"])
+    return analyze_filtered(filtered, sample_rate, config, plot_path=plot_path, n_workers=n_workers)
+
+
+def analyze_filtered(filtered, sample_rate, config, plot_path=None, n_workers=1):
+    """
+    As ``analyze``, but for audio that has already been passed through ``bandpass``
+    with ``config["singing_bandpass_range"]``. Useful when analysing the same recording
+    with many configurations (see ``sweep.py``).
+    """
+    envelope_db = compute_envelope_db(filtered, sample_rate, config)
+    segments = find_segments(envelope_db, sample_rate, config)
+
+    def _analyze_segment(segment):
+        return analyze_segment(filtered, sample_rate, *segment, config)
+
+    if n_workers > 1 and len(segments) > 1:
+        with ThreadPoolExecutor(max_workers=min(n_workers, len(segments))) as executor:
+            results = list(executor.map(_analyze_segment, segments))
+    else:
+        results = [_analyze_segment(segment) for segment in segments]
+
+    notes = [note for note, _ in results if note is not None]
+    tracks = [track for _, track in results]
+
+    if plot_path is not None:
+        plot(filtered, envelope_db, sample_rate, segments, tracks, config, plot_path)
+
+    return notes
+
+
+def bandpass(audio, sample_rate, frequency_range):
+    low, high = frequency_range
+    high = min(high, 0.45 * sample_rate)
+    sos = signal.butter(4, [low, high], btype="bandpass", fs=sample_rate, output="sos")
+    return signal.sosfiltfilt(sos, audio)
+
+
+def ms_to_samples(ms, sample_rate):
+    return int(round(ms * sample_rate / 1000))
+
+
+def compute_envelope_db(audio, sample_rate, config):
+    """
+    Returns the smoothed power envelope in dB relative to its maximum.
+    """
+    window = max(1, ms_to_samples(config["smoothing_env_window_ms"], sample_rate))
+    envelope = signal.oaconvolve(np.square(audio), np.ones(window) / window, mode="same")
+    # Transformed in place, to avoid allocating further full-length arrays
+    np.maximum(envelope, 1e-12, out=envelope)
+    np.divide(envelope, envelope.max(), out=envelope)
+    np.log10(envelope, out=envelope)
+    return np.multiply(envelope, 10, out=envelope)
+
+
+def find_segments(envelope_db, sample_rate, config):
+    """
+    Returns a list of ``(start, end)`` sample indices, one per candidate note.
+    """
+    # Noisy recordings can have a noise floor above db_threshold, in which case we segment relative to that instead
+    noise_floor = np.percentile(envelope_db, NOISE_FLOOR_PERCENTILE)
+    above = envelope_db > max(config["db_threshold"], noise_floor + NOISE_MARGIN_DB)
+    above[:ms_to_samples(config["silence_beginning_ms"], sample_rate)] = False
+
+    edges = np.diff(above.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # Merge segments separated by less than the minimal silence
+    min_gap = ms_to_samples(config["msec_silence"], sample_rate)
+    merged = []
+    for start, end in zip(starts, ends):
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    segments = []
+    min_duration = ms_to_samples(config["minimal_segment_duration"], sample_rate)
+    for start, end in merged:
+        # Notes end once the level drops far enough below their peak
+        peak = start + int(np.argmax(envelope_db[start:end]))
+        end_threshold = envelope_db[peak] + config["db_end_threshold_realtive_2note_start"]
+        below = np.flatnonzero(envelope_db[peak:end] < end_threshold)
+        if len(below) > 0:
+            end = peak + int(below[0])
+        if end - start >= min_duration:
+            segments.append((int(start), int(end)))
+    return segments
+
+
+def analyze_segment(audio, sample_rate, start, end, config):
+    """
+    Estimates the pitch of a single segment.
+    Returns ``(note, track)``, where ``note`` is ``None`` if the segment is rejected,
+    and ``track`` is a ``(times, midi)`` tuple for plotting.
+    """
+    cut_start = start + ms_to_samples(config["cut_pre"], sample_rate)
+    cut_end = end - ms_to_samples(config["cut_post"], sample_rate)
+    low, high = config["pitch_range_allowed"]
+
+    f0 = yin(audio[cut_start:max(cut_start, cut_end)], sample_rate, midi_to_hz(low), midi_to_hz(high))
+    times = (cut_start + np.arange(len(f0)) * ms_to_samples(YIN_HOP_MS, sample_rate)) / sample_rate
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        midi = hz_to_midi(f0)
+    valid = np.isfinite(midi) & (midi >= low) & (midi <= high)
+    track = (times[valid], midi[valid])
+
+    if valid.sum() == 0:
+        return None, track
+
+    median_f0 = float(np.median(midi[valid]))
+    deviations = np.abs(midi[valid] - median_f0)
+    percent_fluctuating = 100 * np.mean(deviations > config["allowed_pitch_flactuations_witin_one_tone"] / 2)
+    if percent_fluctuating > config["percent_of_flcatuating_within_one_tone"]:
+        return None, track
+
+    note = {
+        "onset": start / sample_rate,
+        "offset": end / sample_rate,
+        "median_f0": median_f0,
+        "n_voiced_frames": int(valid.sum()),
+    }
+    return note, track
+
+
+def yin(audio, sample_rate, f0_min, f0_max):
+    """
+    Returns a frame-wise f0 estimate in Hz, with ``nan`` for unvoiced frames.
+    """
+    tau_min = int(sample_rate / f0_max)
+    tau_max = int(np.ceil(sample_rate / f0_min))
+    window = tau_max
+    frame_length = window + tau_max
+    hop = ms_to_samples(YIN_HOP_MS, sample_rate)
+
+    if len(audio) < frame_length:
+        return np.full(0, np.nan)
+
+    frames = np.lib.stride_tricks.sliding_window_view(audio, frame_length)[::hop]
+
+    # Difference function d(tau) = e(0) + e(tau) - 2 r(tau), with the autocorrelation r via the FFT
+    n_fft = 1 << int(np.ceil(np.log2(2 * frame_length)))
+    spectrum = np.fft.rfft(frames, n_fft) * np.conj(np.fft.rfft(frames[:, :window], n_fft))
+    autocorrelation = np.fft.irfft(spectrum, n_fft)[:, :tau_max + 1]
+
+    cumulative_energy = np.concatenate(
+        [np.zeros((len(frames), 1)), np.cumsum(frames ** 2, axis=1)], axis=1
+    )
+    taus = np.arange(tau_max + 1)
+    energy = cumulative_energy[:, taus + window] - cumulative_energy[:, taus]
+    difference = np.maximum(energy[:, :1] + energy - 2 * autocorrelation, 0)
+
+    # Cumulative mean normalized difference
+    cmnd = np.ones_like(difference)
+    cumulative_difference = np.cumsum(difference[:, 1:], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cmnd[:, 1:] = difference[:, 1:] * taus[1:] / cumulative_difference
+    cmnd = np.nan_to_num(cmnd, nan=1.0)
+    cmnd[:, :tau_min] = 1.0
+
+    # First dip below the threshold, followed down to its local minimum
+    below = cmnd < YIN_THRESHOLD
+    voiced = below.any(axis=1)
+    tau = np.argmax(below, axis=1)
+    rows = np.arange(len(frames))
+    for _ in range(tau_max):
+        step = (tau < tau_max) & (cmnd[rows, np.minimum(tau + 1, tau_max)] < cmnd[rows, tau])
+        if not step.any():
+            break
+        tau = tau + step
+
+    # Parabolic interpolation around the chosen lag
+    left = cmnd[rows, np.maximum(tau - 1, 0)]
+    centre = cmnd[rows, tau]
+    right = cmnd[rows, np.minimum(tau + 1, tau_max)]
+    denominator = left - 2 * centre + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shift = np.where(np.abs(denominator) > 1e-12, 0.5 * (left - right) / denominator, 0.0)
+    refined_tau = tau + np.clip(shift, -1, 1)
+
+    f0 = sample_rate / np.maximum(refined_tau, 1)
+    f0[~voiced] = np.nan
+    return f0
+
+
+def midi_to_hz(midi):
+    return 440 * 2 ** ((np.asarray(midi) - 69) / 12)
+
+
+def hz_to_midi(hz):
+    return 69 + 12 * np.log2(np.asarray(hz) / 440)
+
+
+def plot(audio, envelope_db, sample_rate, segments, tracks, config, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    time = np.arange(len(audio)) / sample_rate
+    fig, (ax_envelope, ax_pitch) = plt.subplots(2, 1, sharex=True, figsize=(10, 6))
+    try:
+        ax_envelope.plot(time, envelope_db, linewidth=0.8)
+        ax_envelope.axhline(config["db_threshold"], color="grey", linestyle="--")
+        ax_envelope.set_ylabel("Envelope (dB)")
+        for start, end in segments:
+            ax_envelope.axvspan(start / sample_rate, end / sample_rate, color="orange", alpha=0.3)
+
+        for times, midi in tracks:
+            ax_pitch.plot(times, midi, ".", markersize=2)
+        ax_pitch.set_ylim(*config["pitch_range_allowed"])
+        ax_pitch.set_ylabel("Pitch (MIDI)")
+        ax_pitch.set_xlabel("Time (s)")
+
+        fig.savefig(path, format="png")
+    finally:
+        plt.close(fig)
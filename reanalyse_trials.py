@@ -0,0 +1,66 @@
+"""
+Re-runs the singing analysis and scoring for existing trials, e.g. after changing
+``singing_analysis.SING4ME_CONFIG`` or the analysis backend.
+
+Usage (with the local experiment running):
+
+    bash docker/run python reanalyse_trials.py [trial_id ...]
+
+If no trial IDs are given, all vertical processing trials are re-analysed.
+Trials whose participant is still waiting on feedback go on a feedback lane;
+everything else goes through the rate-limited batch lane (see ``scheduling``),
+so re-analysis never delays participants who are currently taking the test.
+Trials whose analysis is still pending are skipped, as it will score them anyway.
+"""
+import argparse
+import os
+
+import redis
+
+from dallinger import db
+from psynet.experiment import import_local_experiment
+from psynet.trial.main import Trial
+
+import scheduling
+
+TRIAL_MAKER_IDS = ["practice_vertical_processing_trials", "main_vertical_processing_trials"]
+
+
+def reanalyse_trial(trial_id):
+    import_local_experiment()
+    trial = Trial.query.filter_by(id=trial_id).one()
+    trial.reanalyse()
+    trial.score = trial.score_answer(trial.answer, trial.definition)
+    db.session.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trial_ids", nargs="*", type=int)
+    parser.add_argument("--max-pending", type=int, default=scheduling.MAX_PENDING_BATCH_JOBS)
+    args = parser.parse_args(argv)
+
+    import_local_experiment()
+    redis_conn = redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379"))
+
+    query = Trial.query.filter(Trial.trial_maker_id.in_(TRIAL_MAKER_IDS))
+    if args.trial_ids:
+        query = query.filter(Trial.id.in_(args.trial_ids))
+
+    batch = []
+    for trial in query.order_by(Trial.id):
+        if trial.async_post_trial_pending:
+            print(f"Skipping trial {trial.id}, whose analysis is still pending.")
+            continue
+        lane = scheduling.lane_for_trial(trial)
+        if lane == "batch":
+            batch.append((trial.id,))
+        else:
+            scheduling.enqueue(redis_conn, lane, reanalyse_trial, trial.id)
+
+    jobs = scheduling.submit_batch(redis_conn, reanalyse_trial, batch, max_pending=args.max_pending)
+    print(f"Submitted {len(jobs)} batch re-analysis jobs.")
+
+
+if __name__ == "__main__":
+    main()
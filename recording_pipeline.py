@@ -0,0 +1,63 @@
+"""
+The stages that turn a participant's recording into a score: the quality gate,
+singing analysis and scoring.
+
+``VerticalProcessingTrial`` runs these stages live and ``replay_session.py`` replays them,
+so both share this code, and a replay times exactly what runs in the experiment.
+Each function takes an optional ``on_stage(stage, duration)`` callback, which is called
+with the stage's name (one of ``STAGES``) and its duration in seconds once the stage has run.
+"""
+import time
+
+try:
+    from . import audio_codec, recording_quality, singing_analysis
+    from .scoring import score_response
+except ImportError:  # Imported as a top-level module, e.g. by replay_session.py
+    import audio_codec
+    import recording_quality
+    import singing_analysis
+    from scoring import score_response
+
+STAGES = ["quality_gate", "analysis", "scoring"]
+
+
+def run_stage(stage, on_stage, function, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    if on_stage is not None:
+        on_stage(stage, time.perf_counter() - start_time)
+    return result
+
+
+def assess_quality(audio_path, on_stage=None):
+    """
+    Returns the quality assessment of the recording at ``audio_path`` (see ``recording_quality``).
+    """
+    return run_stage("quality_gate", on_stage, read_and_assess, audio_path)
+
+
+def read_and_assess(audio_path):
+    return recording_quality.assess_recording(*audio_codec.read_audio(audio_path))
+
+
+def analyze(audio_path, plot_path, recording_problem, config=None, backend=None, on_stage=None):
+    """
+    Runs the singing analysis (see ``singing_analysis.analyze_recording``), unless the quality gate
+    rejected the recording, in which case we return ``None`` without analysing it.
+    """
+    if recording_problem is not None:
+        return None
+    return run_stage(
+        "analysis", on_stage, singing_analysis.analyze_recording, audio_path, plot_path, backend=backend, config=config
+    )
+
+
+def score(target_pitches, sung_pitches, recording_problem, on_stage=None):
+    return run_stage("scoring", on_stage, compute_score, target_pitches, sung_pitches, recording_problem)
+
+
+def compute_score(target_pitches, sung_pitches, recording_problem):
+    # Recordings rejected by the quality gate score zero
+    if recording_problem is not None:
+        return 0
+    return score_response(target=target_pitches, response=sung_pitches)
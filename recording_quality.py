@@ -0,0 +1,106 @@
+"""
+A cheap check for unusable recordings (silent, clipped, mostly noise, or without any singing),
+run before the full singing analysis so that such recordings can be rejected straight away.
+
+All statistics are computed on non-overlapping frames with vectorized NumPy,
+taking a few milliseconds for a typical recording.
+"""
+import numpy as np
+
+FRAME_MS = 40  # Long enough to contain two periods of the lowest f0 we look for
+F0_RANGE = [60, 1000]  # Hz
+CLIPPING_LEVEL = 0.99  # Samples at or above this (relative to full scale) count as clipped
+LEAD_IN_MS = 200  # The recording starts on the cue to sing, so nobody can react within this time...
+NOISE_PERCENTILE = 10  # ...but in case they sang early, the quietest frames (e.g. between notes) also bound the noise level
+SIGNAL_PERCENTILE = 90  # The loudest frames give the signal level
+VOICING_MARGIN_DB = 10  # Frames must be at least this much louder than the noise level to count as voiced...
+VOICING_THRESHOLD = 0.4  # ...and have a normalized autocorrelation peak above this within F0_RANGE
+
+THRESHOLDS = dict(
+    min_rms_db=-50,
+    max_clipping_ratio=0.01,
+    min_snr_db=10,
+    min_voiced_fraction=0.05,
+)
+
+PROBLEMS = {
+    "silent": "We couldn't hear anything in your recording. Please check that your microphone is connected, "
+              "unmuted, and selected in your browser, and that you're singing loudly enough.",
+    "clipped": "Your recording was distorted because it was too loud. Please sing a little more quietly, "
+               "move further away from your microphone, or turn down your microphone's input level.",
+    "noisy": "There was too much background noise in your recording. Please move to a quieter room "
+             "and sing a little closer to your microphone.",
+    "no_singing": "We couldn't find any singing in your recording. Please make sure you sing each note to 'ta', "
+                  "starting as soon as the recording begins.",
+}
+
+
+def assess_recording(audio, sample_rate, thresholds=None):
+    """
+    Returns a dictionary of quality statistics for the recording, together with a ``problem`` entry:
+    either ``None`` or a key of ``PROBLEMS`` naming the first threshold the recording failed.
+    """
+    if thresholds is None:
+        thresholds = THRESHOLDS
+
+    stats = compute_statistics(audio, sample_rate)
+
+    if stats["rms_db"] < thresholds["min_rms_db"]:
+        problem = "silent"
+    elif stats["clipping_ratio"] > thresholds["max_clipping_ratio"]:
+        problem = "clipped"
+    elif stats["snr_db"] < thresholds["min_snr_db"]:
+        problem = "noisy"
+    elif stats["voiced_fraction"] < thresholds["min_voiced_fraction"]:
+        problem = "no_singing"
+    else:
+        problem = None
+
+    return {**stats, "problem": problem}
+
+
+def compute_statistics(audio, sample_rate):
+    audio = np.asarray(audio, dtype="float64")
+
+    frame_length = int(sample_rate * FRAME_MS / 1000)
+    n_frames = len(audio) // frame_length
+    if n_frames == 0:
+        return dict(rms_db=-np.inf, clipping_ratio=0.0, snr_db=0.0, voiced_fraction=0.0)
+
+    frames = audio[:n_frames * frame_length].reshape(n_frames, frame_length)
+    frame_power = np.mean(frames ** 2, axis=1)
+    frame_db = 10 * np.log10(np.maximum(frame_power, 1e-12))
+
+    # The quietest frames alone would put the noise level inside the singing if it fills the recording
+    n_lead_in_frames = max(1, LEAD_IN_MS // FRAME_MS)
+    noise_db = min(np.median(frame_db[:n_lead_in_frames]), np.percentile(frame_db, NOISE_PERCENTILE))
+    signal_db = np.percentile(frame_db, SIGNAL_PERCENTILE)
+    loud = frame_db > noise_db + VOICING_MARGIN_DB
+
+    n_voiced = np.count_nonzero(compute_periodicity(frames[loud], sample_rate) > VOICING_THRESHOLD)
+
+    return dict(
+        rms_db=float(10 * np.log10(max(np.mean(frame_power), 1e-12))),
+        clipping_ratio=float(np.mean(np.abs(audio) >= CLIPPING_LEVEL)),
+        snr_db=float(signal_db - noise_db),
+        voiced_fraction=float(n_voiced / n_frames),
+    )
+
+
+def compute_periodicity(frames, sample_rate):
+    """
+    Returns, for each frame, the height of the highest normalized autocorrelation peak
+    at a lag within ``F0_RANGE``.
+    """
+    if len(frames) == 0:
+        return np.zeros(0)
+
+    frame_length = frames.shape[1]
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(frames, n=2 * frame_length, axis=1)
+    autocorrelation = np.fft.irfft(np.abs(spectrum) ** 2, axis=1)[:, :frame_length]
+    autocorrelation /= np.maximum(autocorrelation[:, :1], 1e-12)
+
+    min_lag = int(sample_rate / F0_RANGE[1])
+    max_lag = min(frame_length - 1, int(sample_rate / F0_RANGE[0]))
+    return autocorrelation[:, min_lag:max_lag + 1].max(axis=1)
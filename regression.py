@@ -0,0 +1,197 @@
+"""
+Reference-accuracy and speed evaluation for the singing analysis pipeline.
+
+A corpus is a list of labelled recordings, each with the pitches that were actually sung
+(``sung_pitches``) and the chord that the singer was aiming for (``target_pitches``).
+By default we use a deterministic synthetic corpus of sung-like notes (harmonic tones
+with vibrato, a noisy 'ta' onset, and background noise), generated by ``make_synthetic_corpus``;
+hand-annotated recordings can be added via ``load_corpus``.
+
+``evaluate`` runs an analysis backend over the corpus and reports:
+
+- note-detection precision, recall and F1 (a detected note counts as correct
+  if it is within half a semitone of an unmatched labelled note);
+- the mean absolute pitch error of correctly detected notes, in semitones;
+- the proportion of recordings for which ``score_response`` gives the same score
+  for the detected pitches as for the labelled pitches;
+- the runtime per recording.
+
+``test_regression.py`` checks these against the budgets below.
+"""
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import parselmouth
+
+from audio_codec import write_audio
+from compare_backends import match_notes
+from scoring import score_response
+from singing_analysis import analyze_recording
+
+SAMPLE_RATE = 44100
+RECORDING_DURATION = 7.0  # Matches record_duration in VerticalProcessingTrial
+
+ACCURACY_BUDGETS = {
+    "f1": 0.9,
+    "score_agreement": 0.9,
+}
+MAX_MEAN_ABS_PITCH_ERROR = 0.25  # Semitones
+RUNTIME_BUDGETS = {  # Mean seconds per recording, about twice what each backend takes on the synthetic corpus
+    "sing4me": 3.5,
+    "yin": 1.0,
+}
+
+
+def synthesize_note(midi, duration, sample_rate, rng):
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+
+    vibrato = 0.3 * np.sin(2 * np.pi * rng.uniform(4.5, 6.5) * t + rng.uniform(0, 2 * np.pi))
+    drift = rng.normal(0, 0.05) * t / duration
+    f0 = 440 * 2 ** ((midi + vibrato + drift - 69) / 12)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+
+    n_harmonics = 8
+    note = sum(np.sin(k * phase) / k ** 1.5 for k in range(1, n_harmonics + 1))
+
+    attack, release = 0.04, 0.08
+    envelope = np.minimum(1, t / attack) * np.minimum(1, (duration - t) / release)
+    note *= np.clip(envelope, 0, 1)
+
+    # The 't' of 'ta': a short burst of noise just before the vowel
+    consonant = rng.normal(0, 0.3, int(0.02 * sample_rate)) * np.hanning(int(0.02 * sample_rate))
+    return np.concatenate([consonant, note])
+
+
+def make_recording(sung_pitches, rng, sample_rate=SAMPLE_RATE, snr_db=30):
+    audio = np.zeros(int(RECORDING_DURATION * sample_rate))
+    position = int(rng.uniform(0.3, 0.8) * sample_rate)
+    for pitch in sung_pitches:
+        note = synthesize_note(pitch, rng.uniform(0.8, 1.5), sample_rate, rng)
+        end = min(len(audio), position + len(note))
+        audio[position:end] += note[:end - position]
+        position = end + int(rng.uniform(0.2, 0.6) * sample_rate)
+
+    audio *= 0.3 / np.abs(audio).max()
+    signal_rms = np.sqrt(np.mean(audio[audio != 0] ** 2))
+    audio += rng.normal(0, signal_rms * 10 ** (-snr_db / 20), len(audio))
+    return audio
+
+
+def sample_singing_error(rng, sd=0.3, ambiguous_range=(0.4, 0.6)):
+    """
+    Samples a singing error in semitones, avoiding errors so close to ``score_response``'s
+    half-semitone tolerance that the expected score would hinge on a few cents.
+    """
+    while True:
+        error = rng.normal(0, sd)
+        if not ambiguous_range[0] < abs(error) < ambiguous_range[1]:
+            return error
+
+
+def make_synthetic_corpus(n_recordings=20, seed=0):
+    """
+    Returns a list of labelled synthetic recordings.
+    Each singer aims for a 2- or 3-note chord near one of the experiment's vocal centres
+    and sings it with a small error, which is occasionally large enough to cost points.
+    """
+    rng = np.random.default_rng(seed)
+    vocal_centres = [69, 65, 57, 52]  # See VOCAL_RANGES in experiment.py
+
+    corpus = []
+    for i in range(n_recordings):
+        n_notes = int(rng.choice([2, 3]))
+        centre = vocal_centres[i % len(vocal_centres)]
+        intervals = rng.choice(np.arange(-5, 6), size=n_notes, replace=False)
+        target_pitches = sorted(centre + intervals + rng.uniform(-1, 1))
+        sung_pitches = [pitch + sample_singing_error(rng) for pitch in rng.permutation(target_pitches)]
+        corpus.append({
+            "name": f"synthetic_{i:03d}",
+            "audio": make_recording(sung_pitches, rng),
+            "sample_rate": SAMPLE_RATE,
+            "target_pitches": [float(pitch) for pitch in target_pitches],
+            "sung_pitches": [float(pitch) for pitch in sung_pitches],
+        })
+    return corpus
+
+
+def load_corpus(directory):
+    """
+    Loads hand-annotated recordings from ``directory``, which must contain an ``annotations.json`` file
+    of the form ``[{"path": ..., "target_pitches": [...], "sung_pitches": [...]}, ...]``,
+    with paths relative to ``directory``.
+    """
+    with open(os.path.join(directory, "annotations.json")) as file:
+        annotations = json.load(file)
+    return [
+        {
+            "name": annotation["path"],
+            "path": os.path.join(directory, annotation["path"]),
+            "target_pitches": annotation["target_pitches"],
+            "sung_pitches": annotation["sung_pitches"],
+        }
+        for annotation in annotations
+    ]
+
+
+def write_wav(path, audio, sample_rate):
+    write_audio(path, audio, sample_rate, parselmouth.SoundFileFormat.WAV)
+
+
+def evaluate(corpus, backend, config=None):
+    detections = []
+    runtimes = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for recording in corpus:
+            audio_path = recording.get("path")
+            if audio_path is None:
+                audio_path = os.path.join(directory, f"{recording['name']}.wav")
+                write_wav(audio_path, recording["audio"], recording["sample_rate"])
+
+            start_time = time.perf_counter()
+            detected = analyze_recording(
+                audio_path,
+                os.path.join(directory, f"{recording['name']}.png"),
+                backend=backend,
+                config=config,
+            )["pitches"]
+            runtimes.append(time.perf_counter() - start_time)
+            detections.append(detected)
+
+    return compute_metrics(corpus, detections, runtimes)
+
+
+def compute_metrics(corpus, detections, runtimes):
+    """
+    Computes the metrics described in the module docstring, given the pitches detected
+    in each recording of ``corpus`` and the time taken to analyse each one.
+    """
+    n_true_positives = n_detected = n_labelled = 0
+    pitch_errors = []
+    score_agreements = []
+
+    for recording, detected in zip(corpus, detections):
+        matches = match_notes(recording["sung_pitches"], detected)
+        n_true_positives += len(matches)
+        n_detected += len(detected)
+        n_labelled += len(recording["sung_pitches"])
+        pitch_errors += [abs(labelled - estimated) for labelled, estimated in matches]
+        score_agreements.append(
+            score_response(target=recording["target_pitches"], response=detected)
+            == score_response(target=recording["target_pitches"], response=recording["sung_pitches"])
+        )
+
+    precision = n_true_positives / n_detected if n_detected > 0 else 0.0
+    recall = n_true_positives / n_labelled if n_labelled > 0 else 0.0
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0,
+        "mean_abs_pitch_error": float(np.mean(pitch_errors)) if pitch_errors else float("nan"),
+        "score_agreement": float(np.mean(score_agreements)),
+        "mean_runtime": float(np.mean(runtimes)),
+        "max_runtime": float(np.max(runtimes)),
+    }
@@ -0,0 +1,141 @@
+"""
+Replays a participant's session through the recording pipeline, locally and without
+changing the database, timing each stage. Useful for reproducing a performance problem
+or comparing analysis backends on exactly the same stimuli and recordings.
+
+Usage (with the local experiment running, e.g. after importing a production database):
+
+    bash docker/run python replay_session.py <participant_id> [--backend yin] [--output replay.csv]
+
+For each of the participant's vertical processing trials, in order, we:
+
+1. check that the stimuli regenerate exactly from the trial's recorded randomization seed and index;
+2. run the stages of ``recording_pipeline`` on the stored recording, as ``VerticalProcessingTrial`` does:
+   the quality gate, singing analysis and scoring.
+
+Recordings that have been archived in compressed form (see ``archive_recordings.py``) are decoded first.
+
+The replayed score is reported next to the stored score, and the replayed analysis time
+next to the one recorded when the trial was first analysed.
+"""
+import argparse
+import csv
+import math
+import tempfile
+from statistics import mean
+
+from psynet.experiment import import_local_experiment
+from psynet.participant import Participant
+from psynet.trial.main import Trial
+
+import recording_pipeline
+from recording_pipeline import STAGES
+
+TRIAL_MAKER_IDS = ["practice_vertical_processing_trials", "main_vertical_processing_trials"]
+
+
+def regenerate_target_pitches(experiment, participant, definition):
+    draws = experiment.draw_trial_randomization(
+        participant.var.vocal_centre,
+        definition["randomization_seed"],
+        definition["randomization_index"],
+    )
+    pitch_translation = draws["mean_target_pitch"] - mean(definition["chord_type"])
+    return [pitch + pitch_translation for pitch in definition["chord_type"]]
+
+
+def replay_trial(experiment, participant, trial, backend):
+    definition = trial.definition
+    timings = {}
+
+    if "randomization_seed" in definition:
+        stimuli_match = all(
+            math.isclose(regenerated, original)
+            for regenerated, original in zip(
+                regenerate_target_pitches(experiment, participant, definition), definition["target_pitches"]
+            )
+        )
+    else:
+        stimuli_match = None  # Trial predates seeded randomization
+
+    with tempfile.NamedTemporaryFile() as f_audio, tempfile.NamedTemporaryFile() as f_plot:
+        trial.export_recording(f_audio.name)
+
+        quality = recording_pipeline.assess_quality(f_audio.name, on_stage=timings.__setitem__)
+        result = recording_pipeline.analyze(
+            f_audio.name,
+            f_plot.name,
+            quality["problem"],
+            config=trial.get_analysis_config(),
+            backend=backend,
+            on_stage=timings.__setitem__,
+        )
+        sung_pitches = [] if result is None else result["pitches"]
+
+    score = recording_pipeline.score(
+        definition["target_pitches"], sung_pitches, quality["problem"], on_stage=timings.__setitem__
+    )
+
+    return {
+        "trial_id": trial.id,
+        "trial_maker_id": trial.trial_maker_id,
+        "chord_type": "-".join(str(pitch) for pitch in definition["chord_type"]),
+        "randomization_seed": definition.get("randomization_seed"),
+        "randomization_index": definition.get("randomization_index"),
+        "stimuli_match": stimuli_match,
+        "recording_problem": quality["problem"],
+        "sung_pitches": " ".join(f"{pitch:.2f}" for pitch in sung_pitches),
+        "score": score,
+        "original_score": trial.score,
+        "original_analysis_time": trial.var.get("analysis_time", default=None),
+        **{f"{stage}_time": timings.get(stage) for stage in STAGES},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("participant_id", type=int)
+    parser.add_argument("--backend", default=None, help="Analysis backend (default: singing_analysis.ANALYSIS_BACKEND)")
+    parser.add_argument("--output", default="replay.csv")
+    args = parser.parse_args(argv)
+
+    experiment = import_local_experiment()["module"]
+    participant = Participant.query.filter_by(id=args.participant_id).one()
+    trials = (
+        Trial.query
+        .filter_by(participant_id=participant.id)
+        .filter(Trial.trial_maker_id.in_(TRIAL_MAKER_IDS))
+        .order_by(Trial.id)
+        .all()
+    )
+
+    rows = []
+    for trial in trials:
+        row = replay_trial(experiment, participant, trial, args.backend)
+        print(
+            f"Trial {row['trial_id']}: score {row['score']} (originally {row['original_score']}), "
+            + ", ".join(f"{stage} {row[f'{stage}_time']:.3f} s" for stage in STAGES if row[f"{stage}_time"] is not None)
+        )
+        rows.append(row)
+
+    if len(rows) == 0:
+        print(f"Participant {participant.id} has no vertical processing trials.")
+        return
+
+    with open(args.output, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    n_mismatched = sum(row["stimuli_match"] is False for row in rows)
+    n_changed = sum(row["score"] != row["original_score"] for row in rows)
+    print(f"Replayed {len(rows)} trials; results written to {args.output}.")
+    print(f"{n_mismatched} trial(s) whose stimuli didn't regenerate exactly; {n_changed} trial(s) with a different score.")
+    for stage in STAGES:
+        times = [row[f"{stage}_time"] for row in rows if row[f"{stage}_time"] is not None]
+        if times:
+            print(f"  {stage}: mean {sum(times) / len(times):.3f} s, max {max(times):.3f} s")
+
+
+if __name__ == "__main__":
+    main()
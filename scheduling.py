@@ -0,0 +1,62 @@
+"""
+Priority lanes for analysis jobs.
+
+Dallinger's workers take jobs from the ``high``, ``default``, and ``low`` queues in that
+order, so the queue a job is placed on determines its priority. Analyses that a participant
+is currently waiting on go first (main-test trials ahead of practice trials): the experiment
+launches each trial's analysis on its lane's queue (see ``experiment.AnalysisProcess``).
+Batch work such as re-analysis goes on the ``low`` queue and is only fed to the workers while
+the participant-facing queues are empty (see ``submit_batch``).
+"""
+import time
+
+from rq import Queue
+
+LANES = {
+    "feedback_main": "high",
+    "feedback_practice": "default",
+    "batch": "low",
+}
+FOREGROUND_QUEUES = ["high", "default"]
+
+MAX_PENDING_BATCH_JOBS = 2  # Keeps the batch backlog short, so that it can't hold up participant-facing work
+JOB_TIMEOUT = 300
+
+
+def lane_for_trial(trial):
+    """
+    Returns the lane for (re-)analysing ``trial``: a feedback lane if the participant
+    is still taking the experiment and waiting for this trial's feedback, otherwise the batch lane.
+    """
+    if trial.wait_for_feedback and trial.participant.status == "working" and trial.score is None:
+        if trial.trial_maker_id == "practice_vertical_processing_trials":
+            return "feedback_practice"
+        return "feedback_main"
+    return "batch"
+
+
+def get_queue(redis_conn, lane):
+    return Queue(LANES[lane], connection=redis_conn)
+
+
+def get_foreground_queue_depth(redis_conn):
+    return sum(len(Queue(name, connection=redis_conn)) for name in FOREGROUND_QUEUES)
+
+
+def enqueue(redis_conn, lane, function, *args):
+    return get_queue(redis_conn, lane).enqueue(function, *args, job_timeout=JOB_TIMEOUT)
+
+
+def submit_batch(redis_conn, function, arguments, max_pending=MAX_PENDING_BATCH_JOBS, poll_interval=1.0):
+    """
+    Submits ``function(*args)`` for each ``args`` in ``arguments`` to the batch lane,
+    waiting whenever participant-facing jobs are pending or the batch queue is full.
+    Batch work therefore yields to participants between jobs, and its rate is capped.
+    """
+    batch_queue = get_queue(redis_conn, "batch")
+    jobs = []
+    for args in arguments:
+        while get_foreground_queue_depth(redis_conn) > 0 or len(batch_queue) >= max_pending:
+            time.sleep(poll_interval)
+        jobs.append(batch_queue.enqueue(function, *args, job_timeout=JOB_TIMEOUT))
+    return jobs
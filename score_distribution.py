@@ -0,0 +1,67 @@
+"""
+Score distributions shared by all web processes, kept in Redis as histograms
+so that percentiles can be computed without querying the database.
+
+Each participant contributes once per trial maker, when they finish it,
+with one integer value per group they belong to: for example their overall score,
+their score within their voice type, and their percentage of correctly sung notes
+for each chord size and timbre they were tested on. Each group's histogram is a Redis hash
+mapping values to participant counts.
+
+Redis isn't the experiment's permanent record, so the distributions may be lost (e.g. if Redis
+restarts without persistence); the experiment then rebuilds them from the database (see ``is_empty``).
+"""
+KEY_PREFIX = "vertical_processing:score_distribution"
+
+
+def get_histogram_key(trial_maker_id, group):
+    return f"{KEY_PREFIX}:{trial_maker_id}:{group}"
+
+
+def get_recorded_participants_key(trial_maker_id):
+    return f"{KEY_PREFIX}:{trial_maker_id}:participants"
+
+
+def is_empty(redis_conn, trial_maker_id):
+    """
+    Returns ``True`` if nobody has been recorded for the trial maker, either because nobody
+    has finished it yet or because Redis has lost the distributions.
+    """
+    return not redis_conn.exists(get_recorded_participants_key(trial_maker_id))
+
+
+def record_participant(redis_conn, trial_maker_id, participant_id, values):
+    """
+    Adds a participant's ``values`` (a dictionary mapping group names to numbers) to the distributions.
+    Values are rounded to integers. Returns ``False`` if the participant had already been recorded,
+    in which case the distributions are left unchanged.
+    """
+    if not redis_conn.sadd(get_recorded_participants_key(trial_maker_id), participant_id):
+        return False
+
+    pipeline = redis_conn.pipeline()
+    for group, value in values.items():
+        pipeline.hincrby(get_histogram_key(trial_maker_id, group), round(value), 1)
+    pipeline.execute()
+    return True
+
+
+def get_histogram(redis_conn, trial_maker_id, group):
+    histogram = redis_conn.hgetall(get_histogram_key(trial_maker_id, group))
+    return {int(value): int(count) for value, count in histogram.items()}
+
+
+def get_percentile(redis_conn, trial_maker_id, group, value):
+    """
+    Returns the percentile rank of ``value`` within the group's distribution,
+    as ``scipy.stats.percentileofscore`` (with ``kind="rank"``) would for the underlying values,
+    or ``None`` if nobody has been recorded in that group yet.
+    """
+    histogram = get_histogram(redis_conn, trial_maker_id, group)
+    n = sum(histogram.values())
+    if n == 0:
+        return None
+    value = round(value)
+    n_below = sum(count for other, count in histogram.items() if other < value)
+    n_equal = histogram.get(value, 0)
+    return 50 * (2 * n_below + n_equal + (n_equal > 0)) / n
@@ -1,6 +1,13 @@
+import gc
 import json
 
-from sing4me import singing_extract  # noqa - something weird about the sing4me package definition?
+import matplotlib.pyplot as plt
+
+try:
+    from . import audio_codec, pitch_tracking
+except ImportError:  # Imported as a top-level module, e.g. by example_analysis.py
+    import audio_codec
+    import pitch_tracking
 
 SING4ME_CONFIG = dict(
     # Defaults taken from sing4me/sing_experiments/singing_2intervals;
@@ -46,10 +53,62 @@ SING4ME_CONFIG = dict(
 def analyze_recording(
         audio_path,
         plot_path,
+        backend=None,
+        config=None,
+        n_workers=None,
 ):
-    raw = singing_extract.analyze(
+    """
+    Detects the notes sung in the recording at ``audio_path`` and saves a summary plot to ``plot_path``.
+
+    Parameters
+    ----------
+    backend :
+        Name of the analysis backend (a key of ``BACKENDS``); defaults to ``ANALYSIS_BACKEND``.
+    config :
+        Analysis parameters; defaults to ``SING4ME_CONFIG``.
+    n_workers :
+        Number of threads for per-segment work; defaults to ``ANALYSIS_WORKERS``.
+        Only the yin backend uses this, because sing4me segments and tracks pitch internally.
+
+    Returns
+    -------
+    A dictionary with entries ``pitches`` (the median pitch of each sung note, in MIDI semitones)
+    and ``raw`` (the backend's full JSON-serializable output).
+    """
+    if backend is None:
+        backend = ANALYSIS_BACKEND
+    if config is None:
+        config = SING4ME_CONFIG
+    if n_workers is None:
+        n_workers = ANALYSIS_WORKERS
+
+    try:
+        raw = BACKENDS[backend](audio_path, plot_path, config, n_workers)
+    finally:
+        release_analysis_resources()
+
+    return {
+        "pitches": [float(note["median_f0"]) for note in raw],
+        "raw": simplify_numpy_types(raw),
+    }
+
+
+def release_analysis_resources():
+    """
+    sing4me leaves its matplotlib figures open and creates parselmouth objects
+    with reference cycles; without this, long-running workers grow steadily in memory.
+    """
+    plt.close("all")
+    gc.collect()
+
+
+def analyze_with_sing4me(audio_path, plot_path, config, n_workers):
+    # Imported here so that the yin backend can be used without sing4me installed
+    from sing4me import singing_extract  # noqa - something weird about the sing4me package definition?
+
+    return singing_extract.analyze(
         audio_path,
-        SING4ME_CONFIG,
+        config,
         plot_options=singing_extract.PlotOptions(
             save=True,
             path=plot_path,
@@ -57,10 +116,22 @@ def analyze_recording(
         )
     )
 
-    return {
-        "pitches": [float(note["median_f0"]) for note in raw],
-        "raw": simplify_numpy_types(raw),
-    }
+
+def analyze_with_yin(audio_path, plot_path, config, n_workers):
+    audio, sample_rate = audio_codec.read_audio(audio_path)
+    return pitch_tracking.analyze(audio, sample_rate, config, plot_path=plot_path, n_workers=n_workers)
+
+
+BACKENDS = {
+    "sing4me": analyze_with_sing4me,
+    "yin": analyze_with_yin,
+}
+
+# Switch to "yin" once compare_backends.py shows that it agrees with sing4me on our recordings
+ANALYSIS_BACKEND = "sing4me"
+
+# Raise this if the async workers have spare cores; single-trial latency then drops with the number of segments
+ANALYSIS_WORKERS = 1
 
 
 def simplify_numpy_types(x):
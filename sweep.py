@@ -0,0 +1,191 @@
+"""
+Sweeps analysis parameters (entries of ``singing_analysis.SING4ME_CONFIG``) over a labelled corpus,
+reporting the accuracy/runtime tradeoff of each configuration.
+
+Usage:
+
+    # Grid search
+    python sweep.py --grid '{"db_threshold": [-22, -30], "msec_silence": [30, 90]}'
+
+    # Random search over ranges (integers if both bounds are integers)
+    python sweep.py --random 50 --ranges '{"db_threshold": [-40, -15], "minimal_segment_duration": [20, 80]}'
+
+    # Parameters that only sing4me reads (see pitch_tracking.CONFIG_KEYS) need the sing4me backend
+    python sweep.py --backend sing4me --grid '{"extend_pitch_threshold_semitones": [1.0, 2.0, 3.0]}'
+
+By default the synthetic corpus from ``regression.py`` is used; pass ``--corpus`` to use
+hand-annotated recordings instead (see ``regression.load_corpus``). Metrics are as in
+``regression.evaluate``. Each recording is decoded only once, and with the yin backend
+its bandpassed signal is shared by all configurations with the same ``singing_bandpass_range``.
+Configurations are spread across ``--jobs`` processes.
+
+Results are written to ``--output`` (CSV). Configurations on the accuracy/runtime
+Pareto front (no other configuration is both more accurate and faster) are flagged.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import audio_codec
+import pitch_tracking
+import regression
+from singing_analysis import BACKENDS, SING4ME_CONFIG, analyze_recording
+
+_corpus = None
+_backend = None
+_filtered_cache = {}
+
+
+def grid_configurations(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def random_configurations(ranges, n, seed=0):
+    rng = np.random.default_rng(seed)
+    configurations = []
+    for _ in range(n):
+        configuration = {}
+        for name, (low, high) in ranges.items():
+            if isinstance(low, int) and isinstance(high, int):
+                configuration[name] = int(rng.integers(low, high + 1))
+            else:
+                configuration[name] = float(rng.uniform(low, high))
+        configurations.append(configuration)
+    return configurations
+
+
+def init_worker(corpus, backend):
+    global _corpus, _backend
+    _corpus = corpus
+    _backend = backend
+
+
+def get_filtered(index, frequency_range):
+    """
+    Returns the bandpassed audio for recording ``index``, with the time taken to compute it,
+    so that reported runtimes still reflect a standalone analysis.
+    """
+    key = (index, tuple(frequency_range))
+    if key not in _filtered_cache:
+        recording = _corpus[index]
+        start_time = time.perf_counter()
+        filtered = pitch_tracking.bandpass(recording["audio"], recording["sample_rate"], frequency_range)
+        _filtered_cache[key] = (filtered, time.perf_counter() - start_time)
+    return _filtered_cache[key]
+
+
+def run_configuration(parameters):
+    config = {**SING4ME_CONFIG, **parameters}
+    detections = []
+    runtimes = []
+
+    with tempfile.NamedTemporaryFile(suffix=".png") as f_plot:
+        for index, recording in enumerate(_corpus):
+            if _backend == "yin":
+                filtered, bandpass_time = get_filtered(index, config["singing_bandpass_range"])
+                start_time = time.perf_counter()
+                notes = pitch_tracking.analyze_filtered(filtered, recording["sample_rate"], config)
+                runtimes.append(bandpass_time + time.perf_counter() - start_time)
+                detections.append([note["median_f0"] for note in notes])
+            else:
+                start_time = time.perf_counter()
+                result = analyze_recording(recording["path"], f_plot.name, backend=_backend, config=config)
+                runtimes.append(time.perf_counter() - start_time)
+                detections.append(result["pitches"])
+
+    return {**parameters, **regression.compute_metrics(_corpus, detections, runtimes)}
+
+
+def flag_pareto_front(rows):
+    for row in rows:
+        row["pareto_optimal"] = not any(
+            other["f1"] >= row["f1"] and other["mean_runtime"] <= row["mean_runtime"]
+            and (other["f1"] > row["f1"] or other["mean_runtime"] < row["mean_runtime"])
+            for other in rows
+        )
+
+
+def prepare_corpus(corpus, backend, directory):
+    """
+    Decodes annotated recordings (for yin) or writes synthetic ones to disk (for sing4me),
+    once, before the corpus is shared with the worker processes.
+    """
+    for recording in corpus:
+        if backend == "yin" and "audio" not in recording:
+            recording["audio"], recording["sample_rate"] = audio_codec.read_audio(recording["path"])
+        elif backend != "yin" and "path" not in recording:
+            recording["path"] = os.path.join(directory, f"{recording['name']}.wav")
+            regression.write_wav(recording["path"], recording["audio"], recording["sample_rate"])
+            del recording["audio"]
+    return corpus
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grid", type=json.loads, help="JSON object mapping parameter names to lists of values")
+    parser.add_argument("--ranges", type=json.loads, help="JSON object mapping parameter names to [low, high]")
+    parser.add_argument("--random", type=int, default=0, help="Number of random configurations to draw from --ranges")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", default="yin", choices=list(BACKENDS))
+    parser.add_argument("--corpus", help="Directory of hand-annotated recordings (default: synthetic corpus)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="sweep.csv")
+    args = parser.parse_args(argv)
+    if args.random and not args.ranges:
+        parser.error("--random requires --ranges.")
+
+    configurations = []
+    if args.grid:
+        configurations += grid_configurations(args.grid)
+    if args.random:
+        configurations += random_configurations(args.ranges, args.random, args.seed)
+    if len(configurations) == 0:
+        parser.error("Specify --grid and/or --random with --ranges.")
+
+    parameter_names = sorted({name for configuration in configurations for name in configuration})
+    unknown = set(parameter_names) - set(SING4ME_CONFIG)
+    if unknown:
+        parser.error(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    if args.backend == "yin":
+        # Sweeping a parameter the backend ignores would only compare timing noise
+        unused = set(parameter_names) - set(pitch_tracking.CONFIG_KEYS)
+        if unused:
+            parser.error(f"The yin backend doesn't use {', '.join(sorted(unused))}; try --backend sing4me.")
+
+    # Configurations sharing a bandpass range are run together, so that cached signals get reused
+    configurations.sort(key=lambda configuration: json.dumps(
+        configuration.get("singing_bandpass_range", SING4ME_CONFIG["singing_bandpass_range"])
+    ))
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = regression.load_corpus(args.corpus) if args.corpus else regression.make_synthetic_corpus()
+        corpus = prepare_corpus(corpus, args.backend, directory)
+
+        with ProcessPoolExecutor(args.jobs, initializer=init_worker, initargs=(corpus, args.backend)) as executor:
+            rows = list(executor.map(run_configuration, configurations))
+
+    flag_pareto_front(rows)
+    with open(args.output, "w", newline="") as file:
+        metric_names = [name for name in rows[0] if name not in parameter_names]
+        writer = csv.DictWriter(file, fieldnames=parameter_names + metric_names, restval="")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: json.dumps(value) if isinstance(value, list) else value for key, value in row.items()})
+
+    print(f"Ran {len(rows)} configurations on {len(corpus)} recordings; results written to {args.output}.")
+    print("Pareto-optimal configurations (F1 vs. mean runtime):")
+    for row in sorted((row for row in rows if row["pareto_optimal"]), key=lambda row: -row["f1"]):
+        parameters = {name: row[name] for name in parameter_names if name in row}
+        print(f"  F1 {row['f1']:.3f}, {row['mean_runtime']:.3f} s/recording: {parameters}")
+
+
+if __name__ == "__main__":
+    main()
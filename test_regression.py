@@ -0,0 +1,50 @@
+# Accuracy and speed regression tests for the singing analysis pipeline.
+#
+# To run these tests via Docker, run the following in your terminal:
+#
+# bash docker/run pytest test_regression.py
+#
+# Set REGRESSION_CORPUS to a directory of hand-annotated recordings (see regression.load_corpus)
+# to evaluate on those in addition to the synthetic corpus.
+
+import os
+
+import pytest
+
+import regression
+
+BACKENDS = ["sing4me", "yin"]
+
+
+def get_corpora():
+    corpora = {"synthetic": regression.make_synthetic_corpus()}
+    if os.environ.get("REGRESSION_CORPUS"):
+        corpora["annotated"] = regression.load_corpus(os.environ["REGRESSION_CORPUS"])
+    return corpora
+
+
+@pytest.fixture(scope="module", params=BACKENDS)
+def results(request):
+    if request.param == "sing4me":
+        pytest.importorskip("sing4me")
+
+    return {
+        name: regression.evaluate(corpus, backend=request.param)
+        for name, corpus in get_corpora().items()
+    }, request.param
+
+
+def test_accuracy(results):
+    results, backend = results
+    for corpus_name, metrics in results.items():
+        for metric, minimum in regression.ACCURACY_BUDGETS.items():
+            assert metrics[metric] >= minimum, f"{backend}: {metric} on {corpus_name} corpus dropped below {minimum}"
+        assert metrics["mean_abs_pitch_error"] <= regression.MAX_MEAN_ABS_PITCH_ERROR
+
+
+def test_runtime(results):
+    results, backend = results
+    for corpus_name, metrics in results.items():
+        assert metrics["mean_runtime"] <= regression.RUNTIME_BUDGETS[backend], (
+            f"{backend} took {metrics['mean_runtime']:.2f} s per recording on the {corpus_name} corpus"
+        )
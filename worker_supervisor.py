@@ -0,0 +1,185 @@
+"""
+Scales the number of async worker processes with the analysis backlog.
+
+Usage (alongside a locally running experiment):
+
+    bash docker/run python worker_supervisor.py --min-workers 1 --max-workers 4
+
+Every ``--poll-interval`` seconds the supervisor reads the number of pending jobs
+on the participant-facing worker queues (see ``scheduling``) and the recent mean
+analysis time (recorded by ``VerticalProcessingTrial.async_post_trial``). It then
+starts or stops workers so that the backlog can be cleared within ``--target-delay`` seconds.
+Workers started elsewhere (e.g. Dallinger's own workers) count towards the total,
+so ``--min-workers`` and ``--max-workers`` bound all the live workers on these queues. It also
+publishes the queue depth and estimated feedback delay (see ``analysis_status``),
+which the trial page uses to warn participants about slow feedback.
+
+Workers are also recycled once they have processed ``--max-jobs-per-worker`` jobs
+or their memory use (including any forked job processes) exceeds ``--max-worker-memory-mb``,
+which bounds the memory footprint of long-running analysis workers.
+
+Workers are stopped with SIGTERM, which lets rq finish the current job before exiting.
+"""
+import argparse
+import math
+import os
+import shlex
+import signal
+import socket
+import subprocess
+import time
+
+import psutil
+import redis
+from rq import Queue, Worker
+
+import analysis_status
+import scheduling
+
+DEFAULT_ANALYSIS_TIME = 5.0  # Seconds; used until the first analysis times have been recorded
+
+
+class WorkerSupervisor:
+    def __init__(
+            self, redis_conn, worker_command, min_workers, max_workers, target_delay, poll_interval,
+            max_jobs_per_worker, max_worker_memory_mb,
+    ):
+        assert 1 <= min_workers <= max_workers
+        self.redis_conn = redis_conn
+        self.worker_command = worker_command
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.target_delay = target_delay
+        self.poll_interval = poll_interval
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_worker_memory_mb = max_worker_memory_mb
+        # Batch work doesn't count towards the backlog: it only runs when these queues are empty
+        self.queues = [Queue(name, connection=redis_conn) for name in scheduling.FOREGROUND_QUEUES]
+        self.workers = []
+        self.retiring_workers = []
+
+    def get_queue_depth(self):
+        return sum(len(queue) for queue in self.queues)
+
+    def get_n_external_workers(self):
+        """
+        Counts the live rq workers on the participant-facing queues that this supervisor didn't start.
+        """
+        hostname = socket.gethostname()
+        own_pids = {worker.pid for worker in self.workers + self.retiring_workers}
+        return sum(
+            1
+            for worker in Worker.all(connection=self.redis_conn)
+            if set(worker.queue_names()) & set(scheduling.FOREGROUND_QUEUES)
+            and not (worker.hostname == hostname and worker.pid in own_pids)
+        )
+
+    def get_target_n_workers(self, queue_depth, mean_analysis_time):
+        n_workers = math.ceil(queue_depth * mean_analysis_time / self.target_delay)
+        return min(self.max_workers, max(self.min_workers, n_workers))
+
+    def reap_workers(self):
+        for worker in self.workers:
+            if worker.poll() is not None:
+                print(f"Worker {worker.pid} exited with code {worker.returncode}.")
+        self.workers = [worker for worker in self.workers if worker.poll() is None]
+        self.retiring_workers = [worker for worker in self.retiring_workers if worker.poll() is None]
+
+    def recycle_workers(self):
+        job_counts = {
+            worker.pid: worker.successful_job_count + worker.failed_job_count
+            for worker in Worker.all(connection=self.redis_conn)
+        }
+        for worker in list(self.workers):
+            n_jobs = job_counts.get(worker.pid, 0)
+            memory_mb = get_memory_mb(worker.pid)
+            if n_jobs >= self.max_jobs_per_worker or memory_mb >= self.max_worker_memory_mb:
+                print(f"Recycling worker {worker.pid} after {n_jobs} jobs ({memory_mb:.0f} MB).")
+                self.workers.remove(worker)
+                self.retire(worker)
+
+    def start_worker(self):
+        worker = subprocess.Popen(self.worker_command)
+        print(f"Started worker {worker.pid}.")
+        self.workers.append(worker)
+
+    def stop_worker(self):
+        worker = self.workers.pop()
+        print(f"Stopping worker {worker.pid}.")
+        self.retire(worker)
+
+    def retire(self, worker):
+        worker.send_signal(signal.SIGTERM)
+        self.retiring_workers.append(worker)
+
+    def step(self):
+        self.reap_workers()
+        self.recycle_workers()
+
+        queue_depth = self.get_queue_depth()
+        mean_analysis_time = analysis_status.get_mean_analysis_time(self.redis_conn, default=DEFAULT_ANALYSIS_TIME)
+        n_external_workers = self.get_n_external_workers()
+        target = max(0, self.get_target_n_workers(queue_depth, mean_analysis_time) - n_external_workers)
+
+        while len(self.workers) < target:
+            self.start_worker()
+        while len(self.workers) > target:
+            self.stop_worker()
+
+        return analysis_status.publish_status(
+            self.redis_conn,
+            queue_depth=queue_depth,
+            n_workers=n_external_workers + len(self.workers),
+            mean_analysis_time=mean_analysis_time,
+            expires_after=int(3 * self.poll_interval) + 1,
+        )
+
+    def run(self):
+        try:
+            while True:
+                status = self.step()
+                print(
+                    f"Queue depth {status['queue_depth']}, {status['n_workers']} worker(s), "
+                    f"estimated feedback delay {status['estimated_feedback_delay']:.1f} s."
+                )
+                time.sleep(self.poll_interval)
+        finally:
+            while self.workers:
+                self.stop_worker()
+
+
+def get_memory_mb(pid):
+    try:
+        process = psutil.Process(pid)
+        processes = [process] + process.children(recursive=True)
+        return sum(p.memory_info().rss for p in processes) / 1e6
+    except psutil.NoSuchProcess:
+        return 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-workers", type=int, default=1)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--target-delay", type=float, default=10.0, help="Seconds within which to clear the backlog")
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    parser.add_argument("--max-jobs-per-worker", type=int, default=500)
+    parser.add_argument("--max-worker-memory-mb", type=float, default=1024)
+    parser.add_argument("--worker-command", default="dallinger_heroku_worker")
+    args = parser.parse_args(argv)
+
+    supervisor = WorkerSupervisor(
+        redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379")),
+        worker_command=shlex.split(args.worker_command),
+        min_workers=args.min_workers,
+        max_workers=args.max_workers,
+        target_delay=args.target_delay,
+        poll_interval=args.poll_interval,
+        max_jobs_per_worker=args.max_jobs_per_worker,
+        max_worker_memory_mb=args.max_worker_memory_mb,
+    )
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()